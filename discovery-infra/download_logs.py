@@ -1,12 +1,12 @@
 #!/usr/bin/env python3
 
+import asyncio
 import filecmp
 import json
 import os
 import shutil
 import subprocess
 import tempfile
-import time
 from argparse import ArgumentParser
 from collections import Counter
 from contextlib import suppress
@@ -19,16 +19,18 @@ from dateutil.parser import isoparse
 
 from logger import log, suppressAndLog
 from test_infra.assisted_service_api import InventoryClient, create_client
+from test_infra.async_assisted_service_api import AsyncInventoryClient, create_async_client
 from test_infra.consts import ClusterStatus, HostsProgressStages
 from test_infra.helper_classes import cluster as helper_cluster
 from test_infra.logs_utils import verify_logs_uploaded
 from test_infra.utils import (are_host_progress_in_stage, config_etc_hosts,
-                              recreate_folder, run_command)
+                              get_clock, recreate_folder, run_command)
 
 TIME_FORMAT = '%Y-%m-%d_%H:%M:%S'
 MAX_RETRIES = 3
 RETRY_INTERVAL = 60 * 5
 CONNECTION_TIMEOUT = 30
+CLUSTER_FILES = ("bootstrap.ign", "master.ign", "worker.ign", "install-config.yaml")
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -36,22 +38,28 @@ urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 def main():
     args = handle_arguments()
     client = create_client(url=args.inventory_url, timeout=CONNECTION_TIMEOUT)
+    async_client = create_async_client(url=args.inventory_url)
 
-    if args.cluster_id:
-        cluster = client.cluster_get(args.cluster_id)
-        download_logs(client, json.loads(json.dumps(cluster.to_dict(), sort_keys=True, default=str)), args.dest, args.must_gather, args.update_by_events)
-    else:
-        clusters = get_clusters(client, args.download_all)
+    try:
+        if args.cluster_id:
+            cluster = client.cluster_get(args.cluster_id)
+            download_logs(client, json.loads(json.dumps(cluster.to_dict(), sort_keys=True, default=str)), args.dest,
+                          args.must_gather, args.update_by_events, async_client=async_client)
+        else:
+            clusters = get_clusters(client, args.download_all)
 
-        if not clusters:
-            log.info('No clusters were found')
-            return
+            if not clusters:
+                log.info('No clusters were found')
+                return
 
-        for cluster in clusters:
-            if args.download_all or should_download_logs(cluster):
-                download_logs(client, cluster, args.dest, args.must_gather, args.update_by_events)
+            for cluster in clusters:
+                if args.download_all or should_download_logs(cluster):
+                    download_logs(client, cluster, args.dest, args.must_gather, args.update_by_events,
+                                  async_client=async_client)
 
-        print(Counter(map(lambda cluster: cluster['status'], clusters)))
+            print(Counter(map(lambda cluster: cluster['status'], clusters)))
+    finally:
+        asyncio.get_event_loop().run_until_complete(async_client.close())
 
 
 def get_clusters(client, all_cluster):
@@ -95,7 +103,8 @@ def is_update_needed(output_folder: str, update_on_events_update: bool, client:
     return need_update
 
 
-def download_logs(client: InventoryClient, cluster: dict, dest: str, must_gather: bool, update_by_events: bool = False, retry_interval: int = RETRY_INTERVAL):
+def download_logs(client: InventoryClient, cluster: dict, dest: str, must_gather: bool, update_by_events: bool = False, retry_interval: int = RETRY_INTERVAL,
+                  async_client: AsyncInventoryClient = None):
     output_folder = get_logs_output_folder(dest, cluster)
     if not is_update_needed(output_folder, update_by_events, client, cluster):
         log.info(f"Skipping, no need to update {output_folder}.")
@@ -110,13 +119,7 @@ def download_logs(client: InventoryClient, cluster: dict, dest: str, must_gather
         with suppressAndLog(AssertionError, ConnectionError, requests.exceptions.ConnectionError):
             client.download_metrics(os.path.join(output_folder, "metrics.txt"))
 
-        for ignition_file in ("bootstrap.ign", "master.ign", "worker.ign", "install-config.yaml"):
-            with suppress(assisted_service_client.rest.ApiException):
-                client.download_and_save_file(cluster['id'], ignition_file, os.path.join(output_folder, "cluster_files", ignition_file))
-
-        for host_id in map(lambda host: host['id'], cluster['hosts']):
-            with suppressAndLog(assisted_service_client.rest.ApiException):
-                client.download_host_ignition(cluster['id'], host_id, os.path.join(output_folder, "cluster_files"))
+        download_cluster_files(client, cluster, os.path.join(output_folder, "cluster_files"), async_client)
 
         with suppressAndLog(assisted_service_client.rest.ApiException):
             client.download_cluster_events(cluster['id'], get_cluster_events_path(cluster, output_folder))
@@ -149,7 +152,7 @@ def download_logs(client: InventoryClient, cluster: dict, dest: str, must_gather
                     # Skip sleeping on last retry
                     if i < MAX_RETRIES - 1:
                         log.info(f"Going to retry in {retry_interval} seconds")
-                        time.sleep(retry_interval)
+                        get_clock(client).sleep(retry_interval)
 
         kubeconfig_path = os.path.join(output_folder, "kubeconfig-noingress")
 
@@ -165,6 +168,42 @@ def download_logs(client: InventoryClient, cluster: dict, dest: str, must_gather
         run_command(f"chmod -R ugo+rx '{output_folder}'")
 
 
+def download_cluster_files(client: InventoryClient, cluster: dict, files_folder: str,
+                           async_client: AsyncInventoryClient = None):
+    """
+    Downloads the install files and the ignition of every host. They are all fetched at once when an
+    `async_client` is given, otherwise one after the other through `client`.
+    """
+    if async_client is not None:
+        asyncio.get_event_loop().run_until_complete(_download_cluster_files_async(async_client, cluster, files_folder))
+        return
+
+    for file_name in CLUSTER_FILES:
+        with suppress(assisted_service_client.rest.ApiException):
+            client.download_and_save_file(cluster['id'], file_name, os.path.join(files_folder, file_name))
+
+    for host_id in map(lambda host: host['id'], cluster['hosts']):
+        with suppressAndLog(assisted_service_client.rest.ApiException):
+            client.download_host_ignition(cluster['id'], host_id, files_folder)
+
+
+async def _download_cluster_files_async(async_client: AsyncInventoryClient, cluster: dict, files_folder: str):
+    files = [async_client.download_and_save_file(cluster['id'], file_name, os.path.join(files_folder, file_name))
+             for file_name in CLUSTER_FILES]
+    ignitions = [async_client.download_host_ignition(cluster['id'], host['id'], files_folder)
+                 for host in cluster['hosts']]
+    results = await asyncio.gather(*files, *ignitions, return_exceptions=True)
+
+    # Missing files are expected, depending on the cluster's stage, but only missing ignitions are logged
+    for index, result in enumerate(results):
+        if not isinstance(result, BaseException):
+            continue
+        if not isinstance(result, assisted_service_client.rest.ApiException):
+            raise result
+        if index >= len(files):
+            log.error("Failed to download host ignition", exc_info=result)
+
+
 def get_cluster_events_path(cluster, output_folder):
     return os.path.join(output_folder, f"cluster_{cluster['id']}_events.json")
 
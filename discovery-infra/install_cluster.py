@@ -6,7 +6,6 @@ import argparse
 
 from test_infra import assisted_service_api, consts, utils
 import oc_utils
-import waiting
 from logger import log
 from test_infra.tools import terraform_utils
 from test_infra.helper_classes import cluster as helper_cluster
@@ -102,7 +101,7 @@ def run_install_flow(client, cluster_id, kubeconfig_path, pull_secret, tf=None):
     wait_till_installed(client=client, cluster=cluster)
 
     log.info("Download kubeconfig")
-    waiting.wait(
+    utils.wait(
         lambda: client.download_kubeconfig(
             cluster_id=cluster_id, kubeconfig_path=kubeconfig_path
         )
@@ -111,6 +110,7 @@ def run_install_flow(client, cluster_id, kubeconfig_path, pull_secret, tf=None):
         sleep_seconds=20,
         expected_exceptions=Exception,
         waiting_for="Kubeconfig",
+        clock=utils.get_clock(client),
     )
 
     # set new vips
@@ -126,7 +126,7 @@ def download_logs_from_all_hosts(client, cluster_id, output_folder):
     hosts = client.get_cluster_hosts(cluster_id=cluster_id)
     for host in hosts:
         output_file = os.path.join(output_folder, f'host_{host["id"]}.tar.gz')
-        waiting.wait(
+        utils.wait(
             lambda: client.download_host_logs(cluster_id=cluster_id,
                                               host_id=host["id"],
                                               output_file=output_file) is None,
@@ -134,6 +134,7 @@ def download_logs_from_all_hosts(client, cluster_id, output_folder):
             sleep_seconds=20,
             expected_exceptions=Exception,
             waiting_for="Logs",
+            clock=utils.get_clock(client),
         )
 
 
@@ -2,6 +2,9 @@
 import logging
 import re
 import sys
+import threading
+import time
+from collections import OrderedDict
 from contextlib import suppress
 
 
@@ -28,6 +31,48 @@ class suppressAndLog(suppress):
         return res
 
 
+class StateChangeLogger:
+    """
+    Logs a state only when it differs from the last one seen under the same key, plus a heartbeat
+    every `heartbeat_interval` seconds while it stays the same. Messages are %-formatted by logging,
+    so nothing is formatted when the level is disabled.
+    """
+
+    def __init__(self, logger, heartbeat_interval=60, max_keys=1024):
+        self.logger = logger
+        self.heartbeat_interval = heartbeat_interval
+        self.max_keys = max_keys
+        # key -> (state, seen since, last logged at)
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def log(self, level, key, state, msg, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+
+        now = time.monotonic()
+        with self._lock:
+            previous = self._states.get(key)
+            if previous is not None and previous[0] == state:
+                if now - previous[2] < self.heartbeat_interval:
+                    return
+                since = previous[1]
+            else:
+                since = now
+            self._states[key] = (state, since, now)
+            self._states.move_to_end(key)
+            if len(self._states) > self.max_keys:
+                self._states.popitem(last=False)
+
+        if since == now:
+            self.logger.log(level, msg, *args)
+        else:
+            self.logger.log(level, msg + " (unchanged for %ds)", *args, now - since)
+
+    def info(self, key, state, msg, *args):
+        self.log(logging.INFO, key, state, msg, *args)
+
+
 logging.getLogger("requests").setLevel(logging.ERROR)
 logging.getLogger("urllib3").setLevel(logging.ERROR)
 
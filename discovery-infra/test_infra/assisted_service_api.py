@@ -1,21 +1,61 @@
 # -*- coding: utf-8 -*-
 import json
 import os
-import base64
-import requests
+import threading
 import time
+from contextlib import contextmanager
 
 from test_infra import consts, utils
-import shutil
+from test_infra.host_inventory import get_host_view
+from test_infra.tools import api_metrics, cassette, connection_pool
+from test_infra.tools.downloads import RangedDownload, stream_to_file
+from test_infra.tools.sso_token import SsoTokenManager
 import waiting
 from assisted_service_client import ApiClient, Configuration, api, models
 from logger import log
-from retry import retry
+from retry.api import retry_call
+
+
+class HostsSnapshot(object):
+    """Point-in-time listing of a cluster's hosts, indexed by id, MAC address and requested hostname."""
+
+    def __init__(self, hosts):
+        self.hosts = hosts
+        self.taken_at = time.monotonic()
+        self.by_id = {}
+        self.by_mac = {}
+        self.by_name = {}
+        self.macs_by_id = {}
+
+        for host in hosts:
+            self.by_id[host["id"]] = host
+            self.by_name.setdefault(host.get("requested_hostname"), host)
+            macs = [interface.mac_address for interface in get_host_view(host).interfaces]
+            self.macs_by_id[host["id"]] = macs
+            for mac in macs:
+                self.by_mac.setdefault(mac.lower(), host)
+
+    @property
+    def age(self):
+        return time.monotonic() - self.taken_at
+
+    def get_host_by_mac(self, mac):
+        return self.by_mac.get(mac.lower())
+
+    def get_host_by_name(self, host_name):
+        return self.by_name.get(host_name)
 
 
 class InventoryClient(object):
-    def __init__(self, inventory_url, offline_token, pull_secret):
+    def __init__(self, inventory_url, offline_token, pull_secret, hosts_snapshot_ttl=consts.HOSTS_SNAPSHOT_TTL):
         self.inventory_url = inventory_url
+        self.hosts_snapshot_ttl = hosts_snapshot_ttl
+        # Clock of the waits on this client's clusters, virtual when replaying a cassette
+        self.clock = time
+        self._hosts_snapshots = {}
+        self._hosts_snapshots_locks = {}
+        self._hosts_snapshots_lock = threading.Lock()
+        self._hosts_snapshots_generations = {}
         configs = Configuration()
         configs.host = self.inventory_url + "/api/assisted-install/v1"
         configs.verify_ssl = False
@@ -23,6 +63,8 @@ class InventoryClient(object):
         self._set_x_secret_key(configs, pull_secret)
 
         self.api = ApiClient(configuration=configs)
+        connection_pool.share_api_client_pool(self.api)
+        api_metrics.instrument_api_client(self.api)
         self.client = api.InstallerApi(api_client=self.api)
         self.events = api.EventsApi(api_client=self.api)
         self.versions = api.VersionsApi(api_client=self.api)
@@ -33,33 +75,15 @@ class InventoryClient(object):
             log.info("OFFLINE_TOKEN not set, skipping authentication headers")
             return
 
-        def refresh_api_key(config):
-            # Get the properly padded key segment
-            auth = config.api_key.get('Authorization', None)
-            if auth != None:
-                segment = auth.split('.')[1]
-                padding = len(segment) % 4
-                segment = segment + padding * '='
-
-                expires_on = json.loads(base64.b64decode(segment))['exp']
-
-                # if this key doesn't expire or if it has more than 10 minutes left, don't refresh
-                remaining = expires_on - time.time()
-                if expires_on == 0 or remaining > 600:
-                    return
-
-            # fetch new key if expired or not set yet
-            params = {
-                "client_id": "cloud-services",
-                "grant_type": "refresh_token",
-                "refresh_token": offline_token,
-            }
-
-            log.info("Refreshing API key")
-            response = requests.post(os.environ.get("SSO_URL"), data=params)
-            response.raise_for_status()
+        token_manager = SsoTokenManager.get(
+            offline_token,
+            sso_url=os.environ.get("SSO_URL"),
+            cache_path=utils.get_env("API_TOKEN_CACHE_PATH")
+        )
 
-            config.api_key['Authorization'] = response.json()['access_token']
+        def refresh_api_key(config):
+            # Called on every request, served from the manager's cache unless the token is about to expire
+            config.api_key['Authorization'] = token_manager.get_token()
 
         c.api_key_prefix['Authorization'] = 'Bearer'
         c.refresh_api_key_hook = refresh_api_key
@@ -74,12 +98,13 @@ class InventoryClient(object):
 
     def wait_for_api_readiness(self, timeout):
         log.info("Waiting for inventory api to be ready")
-        waiting.wait(
+        utils.wait(
             lambda: self.clusters_list() is not None,
             timeout_seconds=timeout,
             sleep_seconds=5,
             waiting_for="Wait till inventory is ready",
             expected_exceptions=Exception,
+            clock=self.clock,
         )
 
     def create_cluster(self, name, ssh_public_key=None, **cluster_params):
@@ -99,8 +124,45 @@ class InventoryClient(object):
         return result
 
     def get_cluster_hosts(self, cluster_id):
+        return self._fetch_hosts_snapshot(cluster_id).hosts
+
+    def _fetch_hosts_snapshot(self, cluster_id):
         log.info("Getting registered nodes for cluster %s", cluster_id)
-        return self.client.list_hosts(cluster_id=cluster_id)
+        generation = self._hosts_snapshots_generations.get(cluster_id, 0)
+        snapshot = HostsSnapshot(self.client.list_hosts(cluster_id=cluster_id))
+        with self._hosts_snapshots_lock:
+            # A listing that was in flight while the hosts were changed may predate the change
+            if self._hosts_snapshots_generations.get(cluster_id, 0) == generation:
+                self._hosts_snapshots[cluster_id] = snapshot
+        return snapshot
+
+    def get_hosts_snapshot(self, cluster_id):
+        """
+        Returns the latest hosts listing of the given cluster, fetching a new one only if the cached
+        snapshot is older than `hosts_snapshot_ttl` seconds
+        """
+        with self._hosts_snapshots_lock:
+            lock = self._hosts_snapshots_locks.setdefault(cluster_id, threading.Lock())
+
+        # Concurrent lookups wait for a single in-flight listing instead of issuing their own
+        with lock:
+            snapshot = self._hosts_snapshots.get(cluster_id)
+            if snapshot is None or snapshot.age > self.hosts_snapshot_ttl:
+                snapshot = self._fetch_hosts_snapshot(cluster_id)
+            return snapshot
+
+    def invalidate_hosts_snapshot(self, cluster_id):
+        with self._hosts_snapshots_lock:
+            self._hosts_snapshots_generations[cluster_id] = self._hosts_snapshots_generations.get(cluster_id, 0) + 1
+            self._hosts_snapshots.pop(cluster_id, None)
+
+    @contextmanager
+    def _changing_hosts(self, cluster_id):
+        """Drops the hosts snapshot of the cluster once the change made in the block returned or failed"""
+        try:
+            yield
+        finally:
+            self.invalidate_hosts_snapshot(cluster_id)
 
     def get_hosts_in_statuses(self, cluster_id, statuses):
         hosts = self.get_cluster_hosts(cluster_id)
@@ -119,18 +181,6 @@ class InventoryClient(object):
         log.info("Getting cluster with id %s", cluster_id)
         return self.client.get_cluster(cluster_id=cluster_id)
 
-    def _download(self, response, file_path, verify_file_size=False):
-        with open(file_path, "wb") as f:
-            shutil.copyfileobj(response, f)
-        if verify_file_size:
-            content_length = int(response.headers['content-length'])
-            actual_file_size = os.path.getsize(file_path)
-            if actual_file_size < content_length:
-                raise RuntimeError(
-                    f'Could not complete ISO download {file_path}. '\
-                    f'Actual size: {actual_file_size}. Expected size: {content_length}'
-                    )
-
     def generate_image(self, cluster_id, ssh_key, image_type=consts.ImageType.FULL_ISO, static_ips=None):
         log.info("Generating image for cluster %s", cluster_id)
         image_create_params = models.ImageCreateParams(ssh_public_key=ssh_key, image_type=image_type)
@@ -139,14 +189,25 @@ class InventoryClient(object):
             cluster_id=cluster_id, image_create_params=image_create_params
         )
 
-    @retry(exceptions=RuntimeError, tries=2, delay=3)
     def download_image(self, cluster_id, image_path):
         log.info("Downloading image for cluster %s to %s", cluster_id, image_path)
-        response = self.client.download_cluster_iso_with_http_info(
-            cluster_id=cluster_id, _preload_content=False
-        )
-        response_obj = response[0]
-        self._download(response=response_obj, file_path=image_path, verify_file_size=True)
+
+        def fetch(byte_range=None):
+            header_params = {'Accept': 'application/octet-stream'}
+            if byte_range:
+                header_params['Range'] = 'bytes=%d-%d' % byte_range
+            return self.api.call_api(
+                '/clusters/{cluster_id}/downloads/image', 'GET',
+                path_params={'cluster_id': cluster_id},
+                header_params=header_params,
+                auth_settings=['userAuth'],
+                _return_http_data_only=True,
+                _preload_content=False
+            )
+
+        # Retries resume the segments that were already written instead of starting over
+        download = RangedDownload(fetch, image_path)
+        return retry_call(download.run, exceptions=RuntimeError, tries=3, delay=3)
 
     def generate_and_download_image(self, cluster_id, ssh_key, image_path, image_type=consts.ImageType.FULL_ISO, static_ips=None):
         self.generate_image(cluster_id=cluster_id, ssh_key=ssh_key, image_type=image_type, static_ips=static_ips)
@@ -157,9 +218,10 @@ class InventoryClient(object):
             "Setting roles for hosts %s in cluster %s", hosts_with_roles, cluster_id
         )
         hosts = models.ClusterUpdateParams(hosts_roles=hosts_with_roles, hosts_names=hosts_names)
-        return self.client.update_cluster(
-            cluster_id=cluster_id, cluster_update_params=hosts
-        )
+        with self._changing_hosts(cluster_id):
+            return self.client.update_cluster(
+                cluster_id=cluster_id, cluster_update_params=hosts
+            )
 
     def select_installation_disk(self, cluster_id, hosts_with_diskpaths):
         log.info("Setting installation disk for hosts %s in cluster %s", hosts_with_diskpaths, cluster_id)
@@ -169,9 +231,10 @@ class InventoryClient(object):
         
         disks_selected_config = [role_to_selected_disk_config(h["id"], h["path"], h["role"]) for h in hosts_with_diskpaths]
         params = models.ClusterUpdateParams(disks_selected_config=disks_selected_config)
-        return self.client.update_cluster(
-            cluster_id=cluster_id, cluster_update_params=params
-        )
+        with self._changing_hosts(cluster_id):
+            return self.client.update_cluster(
+                cluster_id=cluster_id, cluster_update_params=params
+            )
 
     def set_pull_secret(self, cluster_id, pull_secret):
         log.info(
@@ -183,9 +246,10 @@ class InventoryClient(object):
 
     def update_cluster(self, cluster_id, update_params):
         log.info("Updating cluster %s with params %s", cluster_id, update_params)
-        return self.client.update_cluster(
-            cluster_id=cluster_id, cluster_update_params=update_params
-        )
+        with self._changing_hosts(cluster_id):
+            return self.client.update_cluster(
+                cluster_id=cluster_id, cluster_update_params=update_params
+            )
 
     def delete_cluster(self, cluster_id):
         log.info("Deleting cluster %s", cluster_id)
@@ -193,45 +257,27 @@ class InventoryClient(object):
 
     def deregister_host(self, cluster_id, host_id):
         log.info(f"Deleting host {host_id} in cluster {cluster_id}")
-        self.client.deregister_host(cluster_id=cluster_id, host_id=host_id)
+        with self._changing_hosts(cluster_id):
+            self.client.deregister_host(cluster_id=cluster_id, host_id=host_id)
 
     def get_hosts_id_with_macs(self, cluster_id):
-        hosts = self.get_cluster_hosts(cluster_id)
-        hosts_data = {}
-        for host in hosts:
-            inventory = json.loads(host.get("inventory", '{"interfaces":[]}'))
-            hosts_data[host["id"]] = [
-                interface["mac_address"] for interface in inventory["interfaces"]
-            ]
-        return hosts_data
+        return dict(self.get_hosts_snapshot(cluster_id).macs_by_id)
 
     def get_host_by_mac(self, cluster_id, mac):
-        hosts = self.get_cluster_hosts(cluster_id)
-
-        for host in hosts:
-            inventory = json.loads(host.get("inventory", '{"interfaces":[]}'))
-            if mac.lower() in [
-                interface["mac_address"].lower()
-                for interface in inventory["interfaces"]
-            ]:
-                return host
+        return self.get_hosts_snapshot(cluster_id).get_host_by_mac(mac)
 
     def get_host_by_name(self, cluster_id, host_name):
-        hosts = self.get_cluster_hosts(cluster_id)
-
-        for host in hosts:
-            hostname = host.get('requested_hostname')
-            if hostname == host_name:
-                log.info(f"Requested host by name: {host_name}, host details: {host}")
-                return host
+        host = self.get_hosts_snapshot(cluster_id).get_host_by_name(host_name)
+        if host:
+            log.info(f"Requested host by name: {host_name}, host details: {host}")
+        return host
 
     def download_and_save_file(self, cluster_id, file_name, file_path):
         log.info("Downloading %s to %s", file_name, file_path)
         response = self.client.download_cluster_files(
             cluster_id=cluster_id, file_name=file_name, _preload_content=False
         )
-        with open(file_path, "wb") as _file:
-            _file.write(response.data)
+        stream_to_file(response, file_path)
 
     def download_kubeconfig_no_ingress(self, cluster_id, kubeconfig_path):
         log.info("Downloading kubeconfig-noingress to %s", kubeconfig_path)
@@ -247,16 +293,14 @@ class InventoryClient(object):
         response = self.client.download_host_ignition(
             cluster_id=cluster_id, host_id=host_id, _preload_content=False
         )
-        with open(os.path.join(destination, f"host_{host_id}.ign"), "wb") as _file:
-            _file.write(response.data)
+        stream_to_file(response, os.path.join(destination, f"host_{host_id}.ign"))
 
     def download_kubeconfig(self, cluster_id, kubeconfig_path):
         log.info("Downloading kubeconfig to %s", kubeconfig_path)
         response = self.client.download_cluster_kubeconfig(
             cluster_id=cluster_id, _preload_content=False
         )
-        with open(kubeconfig_path, "wb") as _file:
-            _file.write(response.data)
+        stream_to_file(response, kubeconfig_path)
 
     def download_metrics(self, dest):
         log.info("Downloading metrics to %s", dest)
@@ -264,11 +308,10 @@ class InventoryClient(object):
         url = self.inventory_url
         if not url.startswith('http://'):
             url = f'http://{url}'
-        response = requests.get(f"{url}/metrics")
+        response = connection_pool.get_session().get(f"{url}/metrics", stream=True)
         assert response.status_code == 200
 
-        with open(dest, "w") as _file:
-            _file.write(response.text)
+        stream_to_file(response.raw, dest)
 
     def install_cluster(self, cluster_id):
         log.info("Installing cluster %s", cluster_id)
@@ -287,8 +330,7 @@ class InventoryClient(object):
         response = self.client.download_cluster_logs(
             cluster_id=cluster_id, _preload_content=False
         )
-        with open(output_file, "wb") as _file:
-            _file.write(response.data)
+        stream_to_file(response, output_file)
 
     def get_events(self, cluster_id, host_id=''):
         response = self.events.list_events(
@@ -308,8 +350,7 @@ class InventoryClient(object):
         response = self.client.download_host_logs(
             cluster_id=cluster_id, host_id=host_id, _preload_content=False
         )
-        with open(output_file, "wb") as _file:
-            _file.write(response.data)
+        stream_to_file(response, output_file)
 
     def cancel_cluster_install(self, cluster_id):
         log.info("Canceling installation of cluster %s", cluster_id)
@@ -321,11 +362,13 @@ class InventoryClient(object):
 
     def disable_host(self, cluster_id, host_id):
         log.info(f"Disabling host: {host_id}, in cluster id: {cluster_id}")
-        return self.client.disable_host(cluster_id=cluster_id, host_id=host_id)
+        with self._changing_hosts(cluster_id):
+            return self.client.disable_host(cluster_id=cluster_id, host_id=host_id)
 
     def enable_host(self, cluster_id, host_id):
         log.info(f"Enabling host: {host_id}, in cluster id: {cluster_id}")
-        return self.client.enable_host(cluster_id=cluster_id, host_id=host_id)
+        with self._changing_hosts(cluster_id):
+            return self.client.enable_host(cluster_id=cluster_id, host_id=host_id)
 
     def set_cluster_proxy(self, cluster_id, http_proxy, https_proxy='', no_proxy=''):
         log.info(
@@ -336,9 +379,10 @@ class InventoryClient(object):
             https_proxy=https_proxy,
             no_proxy=no_proxy
         )
-        return self.client.update_cluster(
-            cluster_id=cluster_id, cluster_update_params=update_params
-        )
+        with self._changing_hosts(cluster_id):
+            return self.client.update_cluster(
+                cluster_id=cluster_id, cluster_update_params=update_params
+            )
 
     def get_cluster_install_config(self, cluster_id):
         log.info("Getting install-config for cluster %s", cluster_id)
@@ -357,7 +401,8 @@ class InventoryClient(object):
     def register_host(self, cluster_id, host_id):
         log.info(f"Registering host: {host_id} to cluster: {cluster_id}")
         host_params = models.HostCreateParams(host_id=host_id)
-        self.client.register_host(cluster_id, host_params)
+        with self._changing_hosts(cluster_id):
+            self.client.register_host(cluster_id, host_params)
 
     def host_get_next_step(self, cluster_id, host_id):
         log.info(f"Getting next step for host: {host_id} in cluster: {cluster_id}")
@@ -406,10 +451,24 @@ def create_client(
     offline_token=utils.get_env('OFFLINE_TOKEN'),
     pull_secret="",
     wait_for_api=True,
-    timeout=consts.WAIT_FOR_BM_API
+    timeout=consts.WAIT_FOR_BM_API,
+    hosts_snapshot_ttl=float(utils.get_env('HOSTS_SNAPSHOT_TTL', consts.HOSTS_SNAPSHOT_TTL)),
+    record_cassette=utils.get_env('API_RECORD_CASSETTE'),
+    replay_cassette=utils.get_env('API_REPLAY_CASSETTE')
     ):
     log.info('Creating assisted-service client for url: %s', url)
-    c = InventoryClient(url, offline_token, pull_secret)
+    if replay_cassette:
+        # Replayed responses never reach the service, no need to authenticate
+        offline_token = None
+
+    c = InventoryClient(url, offline_token, pull_secret, hosts_snapshot_ttl)
+    if record_cassette:
+        log.info('Recording assisted-service requests to %s', record_cassette)
+        cassette.record(c.api, record_cassette)
+    elif replay_cassette:
+        log.info('Replaying assisted-service requests from %s', replay_cassette)
+        c.clock = cassette.replay(c.api, replay_cassette).clock
+
     if wait_for_api:
         c.wait_for_api_readiness(timeout)
     return c
@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import json
+import os
+
+import aiohttp
+from assisted_service_client.rest import ApiException
+
+from logger import log
+from test_infra import consts, utils
+from test_infra.tools.downloads import atomic_write
+from test_infra.tools.sso_token import SsoTokenManager
+
+
+class AsyncInventoryClient(object):
+    """
+    asyncio counterpart of the read-heavy InventoryClient methods, for polling and harvesting many
+    clusters from a single thread. Responses are returned as plain dicts, as InventoryClient does
+    for listings, and failed requests raise assisted_service_client's ApiException.
+
+    async with AsyncInventoryClient(url, offline_token) as client:
+        clusters = await asyncio.gather(*(client.cluster_get(cluster_id) for cluster_id in ids))
+    """
+
+    def __init__(self, inventory_url, offline_token=None, pull_secret="",
+                 limit=consts.ASYNC_CLIENT_CONNECTIONS_LIMIT,
+                 limit_per_host=consts.ASYNC_CLIENT_CONNECTIONS_LIMIT_PER_HOST):
+        self.inventory_url = inventory_url
+        self._base_url = self.inventory_url + "/api/assisted-install/v1"
+        self._limit = limit
+        self._limit_per_host = limit_per_host
+        self._session = None
+        self._token_manager = None
+        self._secret_key = None
+
+        if offline_token:
+            self._token_manager = SsoTokenManager.get(
+                offline_token,
+                sso_url=os.environ.get("SSO_URL"),
+                cache_path=utils.get_env("API_TOKEN_CACHE_PATH")
+            )
+        if pull_secret:
+            self._secret_key = json.loads(pull_secret)['auths']['cloud.openshift.com']['auth']
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *_):
+        await self.close()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def _get_session(self):
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self._limit, limit_per_host=self._limit_per_host, ssl=False)
+            self._session = aiohttp.ClientSession(connector=connector)
+        return self._session
+
+    async def _get_headers(self):
+        headers = {}
+        if self._token_manager:
+            token = self._token_manager.get_cached_token()
+            if token is None:
+                # Fetching a new token is blocking, keep it off the event loop
+                token = await asyncio.get_event_loop().run_in_executor(None, self._token_manager.get_token)
+            headers['Authorization'] = f'Bearer {token}'
+        if self._secret_key:
+            headers['X-Secret-Key'] = self._secret_key
+        return headers
+
+    async def _request(self, path, params=None, headers=None):
+        request_headers = await self._get_headers()
+        request_headers.update(headers or {})
+        response = await self._get_session().get(self._base_url + path, params=params, headers=request_headers)
+        if not 200 <= response.status <= 299:
+            error = ApiException(status=response.status, reason=response.reason)
+            error.body = await response.text()
+            response.release()
+            raise error
+        return response
+
+    async def _get_json(self, path, params=None, headers=None):
+        async with await self._request(path, params, headers) as response:
+            return await response.json(content_type=None)
+
+    async def _download(self, path, file_path, params=None):
+        written = 0
+        async with await self._request(path, params) as response:
+            with atomic_write(file_path) as f:
+                async for chunk in response.content.iter_chunked(consts.DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    written += len(chunk)
+        return written
+
+    async def cluster_get(self, cluster_id):
+        log.info("Getting cluster with id %s", cluster_id)
+        return await self._get_json(f"/clusters/{cluster_id}")
+
+    async def get_cluster_hosts(self, cluster_id):
+        log.info("Getting registered nodes for cluster %s", cluster_id)
+        return await self._get_json(f"/clusters/{cluster_id}/hosts")
+
+    async def clusters_list(self):
+        return await self._get_json("/clusters")
+
+    async def get_all_clusters(self):
+        return await self._get_json("/clusters", headers={"get_unregistered_clusters": "true"})
+
+    async def get_events(self, cluster_id, host_id=''):
+        params = {"host_id": host_id} if host_id else None
+        return await self._get_json(f"/clusters/{cluster_id}/events", params)
+
+    async def download_cluster_events(self, cluster_id, output_file):
+        log.info("Downloading cluster events to %s", output_file)
+        events = await self.get_events(cluster_id)
+        with open(output_file, "wb") as _file:
+            _file.write(json.dumps(events, indent=4).encode())
+
+    async def download_cluster_logs(self, cluster_id, output_file):
+        log.info("Downloading cluster logs to %s", output_file)
+        return await self._download(f"/clusters/{cluster_id}/logs", output_file)
+
+    async def download_host_logs(self, cluster_id, host_id, output_file):
+        log.info("Downloading host logs to %s", output_file)
+        return await self._download(f"/clusters/{cluster_id}/hosts/{host_id}/logs", output_file)
+
+    async def download_and_save_file(self, cluster_id, file_name, file_path):
+        log.info("Downloading %s to %s", file_name, file_path)
+        return await self._download(f"/clusters/{cluster_id}/downloads/files", file_path, {"file_name": file_name})
+
+    async def download_kubeconfig_no_ingress(self, cluster_id, kubeconfig_path):
+        log.info("Downloading kubeconfig-noingress to %s", kubeconfig_path)
+        return await self.download_and_save_file(cluster_id, "kubeconfig-noingress", kubeconfig_path)
+
+    async def download_kubeconfig(self, cluster_id, kubeconfig_path):
+        log.info("Downloading kubeconfig to %s", kubeconfig_path)
+        return await self._download(f"/clusters/{cluster_id}/downloads/kubeconfig", kubeconfig_path)
+
+    async def download_host_ignition(self, cluster_id, host_id, destination):
+        log.info("Downloading host %s cluster %s ignition files to %s", host_id, cluster_id, destination)
+        return await self._download(f"/clusters/{cluster_id}/hosts/{host_id}/downloads/ignition",
+                                    os.path.join(destination, f"host_{host_id}.ign"))
+
+
+def create_async_client(url, offline_token=utils.get_env('OFFLINE_TOKEN'), pull_secret="",
+                        limit=consts.ASYNC_CLIENT_CONNECTIONS_LIMIT):
+    log.info('Creating async assisted-service client for url: %s', url)
+    return AsyncInventoryClient(url, offline_token, pull_secret, limit=limit)
@@ -0,0 +1,437 @@
+import json
+import os
+import threading
+import time
+import weakref
+from distutils.util import strtobool
+from typing import Dict, List, Optional, Tuple
+
+from munch import Munch
+from waiting.exceptions import TimeoutExpired
+
+from logger import log
+from test_infra import consts
+from test_infra.event_cursor import EventCursor
+from test_infra.host_inventory import get_host_view
+from test_infra.transition_stats import TransitionStatsStore, TransitionTracker, get_stats_store
+
+
+def index_validations(validations_info) -> Dict[Tuple[str, str], str]:
+    """Maps the (section, id) of every validation in a `validations_info` blob to its status"""
+    validations = json.loads(validations_info or "{}")
+    return {(section, validation["id"]): validation["status"]
+            for section, section_validations in validations.items() for validation in section_validations}
+
+
+class ClusterSnapshot:
+    """Cluster and hosts as returned by a single cluster_get, or by one entry of a clusters listing"""
+
+    def __init__(self, cluster, clock=time):
+        """
+        :param clock: Clock of the waits on the cluster, virtual when the client replays a cassette
+        """
+        self.cluster = cluster
+        self.hosts: List[dict] = [host.to_dict() for host in cluster.hosts or []]
+        self._clock = clock
+        self.taken_at = clock.monotonic()
+        self._validations = None
+
+    @classmethod
+    def from_dict(cls, cluster: dict, clock=time) -> "ClusterSnapshot":
+        # Listings are plain dicts, Munch gives them the attribute access of the swagger models
+        snapshot = cls.__new__(cls)
+        snapshot.cluster = Munch.fromDict(cluster)
+        snapshot.hosts = cluster.get("hosts") or []
+        snapshot._clock = clock
+        snapshot.taken_at = clock.monotonic()
+        snapshot._validations = None
+        return snapshot
+
+    @property
+    def status(self):
+        return self.cluster.status
+
+    @property
+    def age(self):
+        return self._clock.monotonic() - self.taken_at
+
+    def get_host_by_name(self, host_name) -> Optional[dict]:
+        return next((host for host in self.hosts if host.get("requested_hostname") == host_name), None)
+
+    def get_hosts_with_macs(self, macs) -> List[dict]:
+        return [host for host in self.hosts if any(get_host_view(host).has_mac(mac) for mac in macs)]
+
+    @property
+    def validations(self) -> Dict[Optional[str], Dict[Tuple[str, str], str]]:
+        """Validation statuses by (section, id), for the cluster (keyed None) and for every host id"""
+        if self._validations is None:
+            validations = {None: index_validations(self.cluster.validations_info)}
+            for host in self.hosts:
+                validations[host["id"]] = index_validations(host.get("validations_info"))
+            self._validations = validations
+        return self._validations
+
+    def get_validation_status(self, host_id, validation_section, validation_id) -> str:
+        """Status of a validation of the host, or of the cluster when `host_id` is None"""
+        validations = self.validations.get(host_id)
+        if validations is None:
+            return "host not found"
+        return validations.get((validation_section, validation_id), "validation not found")
+
+
+class _Subscription:
+    def __init__(self, predicate, sleep_seconds, deadline, expected_exceptions, abortable):
+        self.predicate = predicate
+        self.sleep_seconds = sleep_seconds
+        self.deadline = deadline
+        self.expected_exceptions = expected_exceptions
+        self.abortable = abortable
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def evaluate(self, snapshot):
+        try:
+            self.result = self.predicate(snapshot)
+        except self.expected_exceptions:
+            self.result = None
+        except BaseException as e:
+            self.error = e
+        if self.result or self.error:
+            self.done.set()
+
+    def abort(self, error):
+        self.error = error
+        self.done.set()
+
+
+class StabilityWindow:
+    """
+    Wraps a snapshot predicate so it only passes once the condition is stable: it held on
+    `observations` consecutive snapshots spanning at least `min_seconds`, or it held for
+    `quiet_seconds` during which `event_cursor` saw no new cluster events. Either criterion can be
+    left out. Snapshots are published by every user of the watcher, so the observations alone say
+    little about how long the condition held.
+    """
+
+    def __init__(self, predicate, observations=None, quiet_seconds=None, event_cursor=None, min_seconds=0,
+                 clock=time):
+        self.predicate = predicate
+        self.observations = observations
+        self.quiet_seconds = quiet_seconds
+        self.event_cursor = event_cursor
+        self.min_seconds = min_seconds
+        self.clock = clock
+        self._held = 0
+        self._held_since = None
+        self._quiet_since = None
+        self._events_count = None
+
+    def _update_events(self, now):
+        try:
+            self.event_cursor.update()
+        except Exception:
+            log.exception("Failed to get cluster %s events", self.event_cursor.cluster_id)
+            self._quiet_since = now
+            return
+        if len(self.event_cursor) != self._events_count:
+            self._events_count = len(self.event_cursor)
+            self._quiet_since = now
+
+    def __call__(self, snapshot):
+        result = self.predicate(snapshot)
+        if not result:
+            self._held = 0
+            self._held_since = None
+            self._quiet_since = None
+            return result
+
+        now = self.clock.monotonic()
+        self._held += 1
+        if self._held_since is None:
+            self._held_since = now
+        if self._quiet_since is None:
+            self._quiet_since = now
+        if self.event_cursor is not None:
+            self._update_events(now)
+
+        if self.observations is not None and self._held >= self.observations \
+                and now - self._held_since >= self.min_seconds:
+            return result
+        if self.quiet_seconds is not None and now - self._quiet_since >= self.quiet_seconds:
+            return result
+        return None
+
+
+class ClusterStateWatcher:
+    """
+    Evaluates every pending wait on a cluster against shared snapshots, so concurrent waits on the
+    same cluster share their requests. Snapshots are fetched by the ClustersPoller of the client.
+    Unless ADAPTIVE_POLLING is disabled, the poll interval follows the recorded durations of past
+    transitions: sparse while the next transition is not expected, dense around it. Otherwise it is
+    the shortest interval any of the waits asked for.
+    With EVENT_DRIVEN_POLLING enabled, the cluster events serve as a change feed: the cluster and its
+    hosts are only fetched again when new events were sent, or when the snapshot is older than
+    EVENT_FEED_MAX_STALENESS seconds.
+    Watchers are only registered for as long as they are referenced, e.g. by a pending wait or by a
+    Cluster, so their snapshots and events do not outlive the tests that use them.
+    """
+
+    # Weak values: a registered watcher references its client, so the id of the client can't be reused
+    _watchers = weakref.WeakValueDictionary()
+    _watchers_lock = threading.Lock()
+
+    def __init__(self, client, cluster_id):
+        self.client = client
+        self.cluster_id = cluster_id
+        self.clock = getattr(client, "clock", time)
+        self._poller = ClustersPoller.get(client)
+        self._poller.add_watcher(self)
+        self._snapshot: Optional[ClusterSnapshot] = None
+        self._subscriptions = []
+        self._listeners = []
+        self._observers = {}
+        self._lock = threading.Lock()
+        self._tracker = None
+        if strtobool(os.environ.get("ADAPTIVE_POLLING", "true")):
+            # Durations measured on a virtual clock (cassette replay) are not real ones
+            self._tracker = TransitionTracker(self.get_stats_store(), record=self.clock is time)
+        self.event_cursor = EventCursor(client, cluster_id)
+        self.event_driven = strtobool(os.environ.get("EVENT_DRIVEN_POLLING", "false"))
+        self._fetched_events_count = None
+
+    @classmethod
+    def get(cls, client, cluster_id) -> "ClusterStateWatcher":
+        key = (id(client), cluster_id)
+        with cls._watchers_lock:
+            watcher = cls._watchers.get(key)
+            if watcher is None:
+                watcher = cls(client, cluster_id)
+                cls._watchers[key] = watcher
+            return watcher
+
+    def get_stats_store(self) -> TransitionStatsStore:
+        """Returns the transition stats of the service the cluster is on"""
+        return get_stats_store(getattr(self.client, "inventory_url", None))
+
+    @property
+    def snapshot(self) -> Optional[ClusterSnapshot]:
+        return self._snapshot
+
+    def get_snapshot(self, max_age=0) -> ClusterSnapshot:
+        """Returns the latest snapshot, fetching a new one if it is older than `max_age` seconds"""
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.age > max_age:
+            snapshot = self.fetch()
+        return snapshot
+
+    def fetch(self) -> ClusterSnapshot:
+        if self.event_driven:
+            snapshot = self._get_unchanged_snapshot()
+            if snapshot is not None:
+                self.publish(snapshot)
+                return snapshot
+            # Events sent while the cluster is fetched are caught by the next check
+            self._fetched_events_count = len(self.event_cursor)
+
+        snapshot = ClusterSnapshot(self.client.cluster_get(self.cluster_id), self.clock)
+        self.publish(snapshot)
+        return snapshot
+
+    def _get_unchanged_snapshot(self) -> Optional[ClusterSnapshot]:
+        """Returns the current snapshot if no events were sent since it was fetched"""
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.age > consts.EVENT_FEED_MAX_STALENESS:
+            return None
+        try:
+            self.event_cursor.update()
+        except Exception:
+            log.exception("Failed to get cluster %s events", self.cluster_id)
+            return None
+        return snapshot if len(self.event_cursor) == self._fetched_events_count else None
+
+    def add_listener(self, listener):
+        """Calls `listener(snapshot)` with every snapshot published from now on"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def get_observer(self, name, create):
+        """
+        Returns the observer registered under `name`, creating it with `create()` and calling its
+        `observe(snapshot)` with every published snapshot if there is none yet. Lets all the objects
+        that handle the same cluster share a single observer of each kind.
+        """
+        with self._lock:
+            if name not in self._observers:
+                observer = create()
+                self._observers[name] = observer
+                self._listeners.append(observer.observe)
+            return self._observers[name]
+
+    def publish(self, snapshot: ClusterSnapshot):
+        """Makes `snapshot` the current one and evaluates the pending waits against it"""
+        self._snapshot = snapshot
+        if self._tracker:
+            self._tracker.observe(snapshot)
+
+        for subscription in self._get_pending():
+            subscription.evaluate(snapshot)
+
+        # Listeners run last, so that they only see the waits the snapshot did not satisfy
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(snapshot)
+            except Exception:
+                log.exception("Cluster %s snapshot listener %s failed", self.cluster_id, listener)
+
+    def abort(self, error: BaseException):
+        """Fails all the pending abortable waits with `error`, returns how many were aborted"""
+        subscriptions = [s for s in self._get_pending() if s.abortable]
+        for subscription in subscriptions:
+            subscription.abort(error)
+        return len(subscriptions)
+
+    def _get_pending(self):
+        with self._lock:
+            return [s for s in self._subscriptions if not s.done.is_set()]
+
+    @property
+    def has_pending(self):
+        return len(self._get_pending()) > 0
+
+    def get_poll_interval(self):
+        subscriptions = self._get_pending()
+        if not subscriptions:
+            return None
+
+        interval = min(s.sleep_seconds for s in subscriptions)
+        if self._tracker:
+            interval = self._tracker.get_poll_interval(default=interval)
+        # Poll once more right before the closest timeout, waits that are past it are about to give up
+        interval = min(interval, min(s.deadline for s in subscriptions) - self.clock.monotonic())
+        return max(interval, consts.CLUSTERS_POLLER_MIN_INTERVAL)
+
+    def wait(self, predicate, timeout_seconds, sleep_seconds=5, waiting_for=None, expected_exceptions=(),
+             abortable=True):
+        """
+        Blocks until `predicate(snapshot)` is truthy and returns its value, like waiting.wait.
+        Exceptions raised by the predicate are re-raised here, unless listed in `expected_exceptions`.
+        Abortable waits also fail early when the cluster is aborted, e.g. by its InstallWatchdog.
+        """
+        deadline = self.clock.monotonic() + timeout_seconds
+        subscription = _Subscription(predicate, sleep_seconds, deadline, expected_exceptions, abortable)
+
+        with self._lock:
+            self._subscriptions.append(subscription)
+        self._poller.wake()
+
+        try:
+            while not subscription.done.is_set():
+                remaining = deadline - self.clock.monotonic()
+                if remaining <= 0:
+                    raise TimeoutExpired(timeout_seconds, waiting_for or str(predicate))
+                # Bounded so that a virtual clock is still honored
+                subscription.done.wait(min(remaining, 1))
+        finally:
+            with self._lock:
+                self._subscriptions.remove(subscription)
+
+        if subscription.error is not None:
+            raise subscription.error
+        return subscription.result
+
+
+class ClustersPoller:
+    """
+    Fetches snapshots for all the clusters of a client that have pending waits, from a single thread.
+    A single waited cluster is fetched with cluster_get, several are served by one clusters listing
+    per tick, so the number of requests does not grow with the number of clusters.
+    """
+
+    # Referenced by the watchers of the client and by the polling thread, weak values as for the watchers
+    _pollers = weakref.WeakValueDictionary()
+    _pollers_lock = threading.Lock()
+
+    def __init__(self, client):
+        self.client = client
+        self.clock = getattr(client, "clock", time)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._watchers = weakref.WeakSet()
+
+    @classmethod
+    def get(cls, client) -> "ClustersPoller":
+        with cls._pollers_lock:
+            poller = cls._pollers.get(id(client))
+            if poller is None:
+                poller = cls(client)
+                cls._pollers[id(client)] = poller
+            return poller
+
+    def add_watcher(self, watcher):
+        with self._lock:
+            self._watchers.add(watcher)
+
+    def wake(self):
+        """Polls right away, starting the polling thread if needed"""
+        with self._lock:
+            self._wakeup.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="clusters-poller", daemon=True)
+                self._thread.start()
+
+    def _get_active_watchers(self):
+        # Called with self._lock held
+        return [w for w in list(self._watchers) if w.has_pending]
+
+    def _run(self):
+        while True:
+            with self._lock:
+                self._wakeup.clear()
+                watchers = self._get_active_watchers()
+                if not watchers:
+                    self._thread = None
+                    return
+
+            if len(watchers) >= consts.CLUSTERS_POLLER_LIST_THRESHOLD:
+                self._poll_listing(watchers)
+            else:
+                for watcher in watchers:
+                    self._poll_one(watcher)
+
+            intervals = [i for i in (w.get_poll_interval() for w in watchers) if i is not None]
+            if intervals:
+                self._sleep(min(intervals))
+
+    def _poll_one(self, watcher):
+        try:
+            watcher.fetch()
+        except Exception:
+            log.exception("Failed to get cluster %s info", watcher.cluster_id)
+
+    def _poll_listing(self, watchers):
+        try:
+            clusters = {cluster["id"]: cluster for cluster in self.client.clusters_list()}
+        except Exception:
+            log.exception("Failed to list clusters")
+            return
+
+        for watcher in watchers:
+            cluster = clusters.get(watcher.cluster_id)
+            if cluster is None:
+                # Not part of the listing (e.g. unregistered), fall back to fetching it alone
+                self._poll_one(watcher)
+            else:
+                watcher.publish(ClusterSnapshot.from_dict(cluster, watcher.clock))
+
+    def _sleep(self, seconds):
+        # New waits cut the sleep short so their first evaluation is immediate
+        deadline = self.clock.monotonic() + seconds
+        while not self._wakeup.is_set():
+            remaining = deadline - self.clock.monotonic()
+            if remaining <= 0:
+                return
+            self.clock.sleep(min(remaining, 0.5))
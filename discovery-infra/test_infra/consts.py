@@ -5,6 +5,10 @@ TF_MAIN_JSON_NAME = "main.tf"
 BASE_IMAGE_FOLDER = "/tmp/images"
 IMAGE_NAME = "installer-image.iso"
 STORAGE_PATH = "/var/lib/libvirt/openshift-images"
+LIBVIRT_URI = "qemu:///system"
+LIBVIRT_DNSMASQ_DIR = "/var/lib/libvirt/dnsmasq"
+LIBVIRT_LEASES_CHECK_INTERVAL = 0.5
+NODES_OPERATIONS_MAX_WORKERS = 5
 SSH_KEY = "ssh_key/key.pub"
 NODES_REGISTERED_TIMEOUT = 60 * 20
 CLUSTER_INSTALLATION_TIMEOUT = 60 * 60   # 60 minutes
@@ -16,6 +20,10 @@ OCS_VALIDATION_TIMEOUT = 10 * 60
 WORKER_CPU = 2
 MASTER_CPU = 4
 READY_TIMEOUT = 60 * 15
+# The cluster is considered settled in ready after this many polls or this long without events
+READY_STABLE_OBSERVATIONS = 6
+READY_STABLE_MIN_SECONDS = 90
+READY_QUIET_SECONDS = 30
 DISCONNECTED_TIMEOUT = 60 * 10
 PENDING_USER_ACTION_TIMEOUT = 60 * 30
 ERROR_TIMEOUT = 60 * 10
@@ -29,6 +37,30 @@ TEST_NETWORK = "test-infra-net-"
 TEST_SECONDARY_NETWORK = "test-infra-secondary-network-"
 DEFAULT_CLUSTER_KUBECONFIG_PATH = "build/kubeconfig"
 WAIT_FOR_BM_API = 900
+HTTP_POOL_CONNECTIONS = 10
+SSO_TOKEN_REFRESH_WINDOW = 10 * 60
+HTTP_POOL_MAXSIZE = 20
+ASYNC_CLIENT_CONNECTIONS_LIMIT = 100
+ASYNC_CLIENT_CONNECTIONS_LIMIT_PER_HOST = 50
+API_METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+API_METRICS_MAX_SAMPLES = 10000
+CASSETTE_MAX_BODY_SIZE = 64 * 1024 ** 2
+DOWNLOAD_SEGMENTS = 4
+DOWNLOAD_MIN_SEGMENT_SIZE = 16 * 1024 ** 2
+DOWNLOAD_CHUNK_SIZE = 1024 ** 2
+TRANSITION_STATS_PATH = "/tmp/assisted_test_infra_transition_stats.json"
+TRANSITION_STATS_MAX_SAMPLES = 100
+ADAPTIVE_POLL_MIN_INTERVAL = 1
+ADAPTIVE_POLL_MAX_INTERVAL = 60
+ADAPTIVE_POLL_MIN_SAMPLES = 3
+CLUSTERS_POLLER_LIST_THRESHOLD = 2
+CLUSTERS_POLLER_MIN_INTERVAL = 1
+HOSTS_SNAPSHOT_TTL = 3   # seconds, shorter than the polling interval of the wait helpers
+STATUS_LOG_HEARTBEAT_INTERVAL = 60
+EVENT_FEED_MAX_STALENESS = 60
+INSTALL_WATCHDOG_STAGE_FACTOR = 3   # times the longest recorded duration of a stage
+INSTALL_WATCHDOG_MIN_STAGE_SECONDS = 60 * 10
+INSTALL_WATCHDOG_EVENTS_INTERVAL = 30
 NAMESPACE_POOL_SIZE = 15
 PODMAN_FLAGS = "--cgroup-manager=cgroupfs --storage-driver=vfs --events-backend=file"
 LOG_FOLDER = "/tmp/assisted_test_infra_logs"
@@ -51,8 +83,10 @@ class NodeRoles:
 
 
 class NodesStatus:
+    DISCOVERING = "discovering"
     INSUFFICIENT = "insufficient"
     KNOWN = "known"
+    PREPARING_FOR_INSTALLATION = "preparing-for-installation"
     INSTALLING = "installing"
     INSTALLING_IN_PROGRESS = "installing-in-progress"
     INSTALLING_PENDING_USER_ACTION = "installing-pending-user-action"
@@ -89,6 +123,9 @@ class HostsProgressStages:
     DONE = "Done"
 
 
+# Waits for these statuses expect the installation to fail, so the install watchdog must not abort them
+failure_statuses = [NodesStatus.ERROR, NodesStatus.INSTALLING_PENDING_USER_ACTION, ClusterStatus.CANCELLED]
+
 all_host_stages = [HostsProgressStages.START_INSTALLATION, HostsProgressStages.INSTALLING,
                    HostsProgressStages.WRITE_IMAGE_TO_DISK, HostsProgressStages.WAIT_FOR_CONTROL_PLANE,
                    HostsProgressStages.REBOOTING, HostsProgressStages.WAIT_FOR_IGNITION,
@@ -0,0 +1,153 @@
+import re
+import string
+import threading
+import xml.etree.ElementTree as ET
+from typing import Callable, List, Optional
+
+# Keeps the usual prefix of the QEMU extensions when a descriptor is serialized back
+ET.register_namespace("qemu", "http://libvirt.org/schemas/domain/qemu/1.0")
+
+
+class DomainDescriptor:
+    """Parsed libvirt domain XML, with accessors for the parts the node controllers read"""
+
+    def __init__(self, xml: str):
+        self.root = ET.fromstring(xml)
+
+    def to_xml(self) -> str:
+        return ET.tostring(self.root, encoding="unicode")
+
+    @property
+    def vcpu(self) -> int:
+        return int(self.root.find("vcpu").text)
+
+    @property
+    def memory_kib(self) -> int:
+        return int(self.root.find("memory").text)
+
+    @property
+    def current_memory_kib(self) -> int:
+        return int(self.root.find("currentMemory").text)
+
+    @property
+    def disks(self) -> List[ET.Element]:
+        return self.root.findall("./devices/disk")
+
+    @property
+    def scsi_disks(self) -> List[ET.Element]:
+        """All disks that use an SCSI bus (/dev/sd*)"""
+        return [disk for disk in self.disks if any(target.get("bus") == "scsi" for target in disk.findall("target"))]
+
+    @property
+    def boot_devices(self) -> List[str]:
+        return [boot.get("dev") for boot in self.root.findall("./os/boot")]
+
+    @property
+    def interfaces(self) -> List[ET.Element]:
+        return self.root.findall("./devices/interface")
+
+    def set_boot_order(self, cd_first=False):
+        os_element = self.root.find("os")
+        for boot in os_element.findall("boot"):
+            dev = boot.get("dev")
+            if dev not in ("cdrom", "hd"):
+                raise ValueError(f"Found unexpected boot device: '{dev}'")
+            os_element.remove(boot)
+        ET.SubElement(os_element, "boot", dev="cdrom" if cd_first else "hd")
+        ET.SubElement(os_element, "boot", dev="hd" if cd_first else "cdrom")
+
+    def set_memory_kib(self, memory_kib: int):
+        self.root.find("memory").text = str(memory_kib)
+        self.root.find("currentMemory").text = str(memory_kib)
+
+    def set_vcpu(self, vcpu: int):
+        vcpu_element = self.root.find("vcpu")
+        vcpu_element.text = str(vcpu)
+        # A lower current count would keep only part of the new vcpus online
+        vcpu_element.attrib.pop("current", None)
+
+    def get_available_scsi_dev(self) -> str:
+        """
+        :return: Returns, for example, `sdd` if `sda`, `sdb`, `sdc`, `sde` are all already in use
+        """
+        in_use = set()
+        for disk in self.scsi_disks:
+            targets = disk.findall("target")
+            assert len(targets) == 1, f"Disks shouldn't have multiple targets, {targets}"
+            in_use.update(re.findall(r"^sd(.*)$", targets[0].get("dev")))
+
+        try:
+            return "sd" + next(candidate for candidate in string.ascii_lowercase if candidate not in in_use)
+        except StopIteration:
+            raise ValueError(f"Couldn't find available scsi disk letter, all are taken: {sorted(in_use)}")
+
+    def get_disks_by_alias_prefix(self, prefix: str) -> List[ET.Element]:
+        return [disk for disk in self.disks
+                if any(alias.get("name", "").startswith(prefix) for alias in disk.findall("alias"))]
+
+    def add_disk(self, source_file: str, target_dev: str, alias: Optional[str] = None):
+        disk = ET.SubElement(self.root.find("devices"), "disk", type="file", device="disk")
+        if alias:
+            ET.SubElement(disk, "alias", name=alias)
+        ET.SubElement(disk, "driver", name="qemu", type="qcow2")
+        ET.SubElement(disk, "source", file=source_file)
+        ET.SubElement(disk, "target", dev=target_dev, bus="scsi")
+
+    def remove_disk(self, alias: str) -> ET.Element:
+        """Removes the disk with the given alias and returns it"""
+        for disk in self.disks:
+            if any(element.get("name") == alias for element in disk.findall("alias")):
+                self.root.find("devices").remove(disk)
+                return disk
+        raise ValueError(f"Found no disk with alias '{alias}'")
+
+    def add_interface(self, network_name: str, mac: str, target_dev: Optional[str] = None):
+        interface = ET.SubElement(self.root.find("devices"), "interface", type="network")
+        ET.SubElement(interface, "mac", address=mac)
+        ET.SubElement(interface, "source", network=network_name)
+        if target_dev:
+            ET.SubElement(interface, "target", dev=target_dev)
+
+    def remove_interface(self, mac: str):
+        for interface in self.interfaces:
+            if any(element.get("address") == mac for element in interface.findall("mac")):
+                self.root.find("devices").remove(interface)
+                return
+        raise ValueError(f"Found no interface with mac '{mac}'")
+
+
+class DomainDescriptorCache:
+    """
+    Descriptors of domains by name, parsed once from XMLDesc() until invalidated. The node controllers
+    invalidate a domain's descriptor whenever they change it, and on every libvirt event of the domain.
+    """
+
+    def __init__(self):
+        self._descriptors = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, name: str, get_xml: Callable[[], str]) -> DomainDescriptor:
+        """Returns the descriptor of domain `name`, parsing the XML returned by `get_xml` if needed"""
+        with self._lock:
+            descriptor = self._descriptors.get(name)
+            generation = self._generation
+        if descriptor is not None:
+            return descriptor
+
+        # Fetched without holding the lock, so that concurrent lookups of other domains are not serialized
+        descriptor = DomainDescriptor(get_xml())
+        with self._lock:
+            # An invalidation while the XML was fetched may mean that it is already outdated
+            if self._generation == generation:
+                descriptor = self._descriptors.setdefault(name, descriptor)
+        return descriptor
+
+    def invalidate(self, name: Optional[str] = None):
+        """Drops the descriptor of the given domain, or all of them"""
+        with self._lock:
+            self._generation += 1
+            if name is None:
+                self._descriptors.clear()
+            else:
+                self._descriptors.pop(name, None)
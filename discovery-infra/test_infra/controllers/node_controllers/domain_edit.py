@@ -0,0 +1,102 @@
+import random
+from typing import Callable, List, Optional
+
+from test_infra.controllers.node_controllers.domain_descriptor import DomainDescriptor
+
+
+def generate_mac() -> str:
+    """Returns a random MAC address with the prefix that libvirt uses for the ones it generates"""
+    return "52:54:00:" + ":".join(f"{random.randint(0, 255):02x}" for _ in range(3))
+
+
+class DomainEdit:
+    """
+    Changes to the definition of a domain, that are only recorded until committed. A commit applies
+    all of them to the domain XML at once, with a single defineXML, shutting the domain down before
+    and starting it again after if needed. Can be used as a context manager that commits on exit:
+
+        with node.edit(start=True) as edit:
+            edit.set_boot_order(cd_first=False)
+            edit.set_ram_kib(ram_kib)
+    """
+
+    def __init__(self, controller, node_name: str, start: Optional[bool] = None):
+        """
+        :param start: Whether to start the domain after the commit. By default it is started again only
+                      if it was running before.
+        """
+        self.controller = controller
+        self.node_name = node_name
+        self.start = start
+        self._edits: List[Callable[[DomainDescriptor], None]] = []
+        self._after_commit: List[Callable[[], None]] = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.commit()
+
+    def __bool__(self):
+        return bool(self._edits)
+
+    def apply(self, descriptor: DomainDescriptor):
+        """Applies the recorded edits to the given descriptor"""
+        for edit in self._edits:
+            edit(descriptor)
+
+    def commit(self):
+        # Filled again by the edits when they are applied
+        self._after_commit = []
+        self.controller.commit_edit(self)
+        self._edits = []
+        for callback in self._after_commit:
+            callback()
+        self._after_commit = []
+
+    def set_boot_order(self, cd_first=False):
+        self._edits.append(lambda descriptor: descriptor.set_boot_order(cd_first))
+
+    def set_ram_kib(self, ram_kib: int):
+        self._edits.append(lambda descriptor: descriptor.set_memory_kib(ram_kib))
+
+    def set_cpu_cores(self, core_count: int):
+        self._edits.append(lambda descriptor: descriptor.set_vcpu(core_count))
+
+    def attach_test_disk(self, disk_size, bootable=False) -> str:
+        """
+        Creates a disk of the given size that is attached to the domain on commit, and can later be
+        detached with detach_all_test_disks
+        :return: The path of the created disk
+        """
+        disk_path = self.controller.create_test_disk(disk_size, bootable)
+
+        def add_disk(descriptor):
+            target_dev = descriptor.get_available_scsi_dev()
+            descriptor.add_disk(disk_path, target_dev, alias=f"{self.controller.TEST_DISKS_PREFIX}-{target_dev}")
+
+        self._edits.append(add_disk)
+        return disk_path
+
+    def detach_all_test_disks(self):
+        """Detaches all the test disks on commit, their files are removed once it succeeded"""
+        def remove_disks(descriptor):
+            for disk in descriptor.get_disks_by_alias_prefix(self.controller.TEST_DISKS_PREFIX):
+                descriptor.remove_disk(disk.find("alias").get("name"))
+                source_file = disk.find("source").get("file")
+                self._after_commit.append(lambda path=source_file: self.controller.remove_test_disk(path))
+
+        self._edits.append(remove_disks)
+
+    def add_interface(self, network_name: str, target_interface: Optional[str] = None, mac: Optional[str] = None) -> str:
+        """
+        Adds an interface connected to the given network on commit
+        :return: The MAC address of the interface
+        """
+        mac = mac or generate_mac()
+        self._edits.append(lambda descriptor: descriptor.add_interface(network_name, mac, target_interface))
+        return mac
+
+    def undefine_interface(self, mac: str):
+        self._edits.append(lambda descriptor: descriptor.remove_interface(mac))
@@ -1,6 +1,4 @@
 import os
-import re
-import string
 import logging
 import tempfile
 from abc import ABC
@@ -8,11 +6,13 @@ from typing import List
 
 import libvirt
 import waiting
-from xml.dom import minidom
-from contextlib import suppress
 
 from test_infra import utils
 from test_infra import consts
+from test_infra.tools import libvirt_connection, libvirt_events
+from test_infra.tools.concurrently import run_concurrently
+from test_infra.controllers.node_controllers.domain_descriptor import DomainDescriptor, DomainDescriptorCache
+from test_infra.controllers.node_controllers.domain_edit import DomainEdit
 from test_infra.controllers.node_controllers.node_controller import NodeController
 
 
@@ -20,14 +20,13 @@ class LibvirtController(NodeController, ABC):
     TEST_DISKS_PREFIX = "ua-TestInfraDisk"
 
     def __init__(self, **kwargs):
-        self.libvirt_connection = libvirt.open('qemu:///system')
+        self.libvirt_connection = libvirt_connection.get_connection()
+        self._descriptors = DomainDescriptorCache()
+        self._events = libvirt_events.get_events()
+        self._events.add_domain_listener(self._descriptors.invalidate)
         self.private_ssh_key_path = kwargs.get("private_ssh_key_path")
         self._setup_timestamp = utils.run_command("date +\"%Y-%m-%d %T\"")[0]
 
-    def __del__(self):
-        with suppress(Exception):
-            self.libvirt_connection.close()
-
     @property
     def setup_time(self):
         return self._setup_timestamp
@@ -60,13 +59,22 @@ class LibvirtController(NodeController, ABC):
 
         if node.isActive():
             node.destroy()
+            self._descriptors.invalidate(node_name)
+
+    def _run_on_nodes(self, operation, nodes, *args):
+        """
+        Runs `operation(node_name, *args)` on all the given nodes concurrently. Failures are raised once
+        all of them are done: the error itself if a single node failed, otherwise a ConcurrentJobsError
+        holding the error of every failed node by name.
+        """
+        return run_concurrently({node.name(): (operation, node.name(), *args) for node in nodes},
+                                max_workers=consts.NODES_OPERATIONS_MAX_WORKERS, collect_errors=True)
 
     def shutdown_all_nodes(self):
         logging.info("Going to shutdown all the nodes")
         nodes = self.list_nodes()
 
-        for node in nodes:
-            self.shutdown_node(node.name())
+        self._run_on_nodes(self.shutdown_node, nodes)
 
     def start_node(self, node_name, check_ips):
         logging.info("Going to power-on %s, check ips flag %s", node_name, check_ips)
@@ -75,21 +83,22 @@ class LibvirtController(NodeController, ABC):
         if not node.isActive():
             try:
                 node.create()
+                self._descriptors.invalidate(node_name)
                 if check_ips:
                     self._wait_till_domain_has_ips(node)
             except waiting.exceptions.TimeoutExpired:
                 logging.warning("Node %s failed to recive IP, retrying", node_name)
                 self.shutdown_node(node_name)
                 node.create()
+                self._descriptors.invalidate(node_name)
                 if check_ips:
                     self._wait_till_domain_has_ips(node)
 
-    def start_all_nodes(self):
+    def start_all_nodes(self, check_ips=True):
         logging.info("Going to power-on all the nodes")
         nodes = self.list_nodes()
 
-        for node in nodes:
-            self.start_node(node.name())
+        self._run_on_nodes(self.start_node, nodes, check_ips)
         return nodes
 
     @staticmethod
@@ -120,77 +129,87 @@ class LibvirtController(NodeController, ABC):
 
         cls.create_disk(disk_path, image_size)
 
-    @staticmethod
-    def _get_all_scsi_disks(node):
+    def _get_descriptor(self, node_name) -> DomainDescriptor:
         """
-        :return: All node disks that use an SCSI bus (/dev/sd*)
+        :return: The parsed live XML description of the node, cached until libvirt reports a change of the
+                 node. Only for reading, definitions are built from `_get_inactive_descriptor`.
         """
-        def is_scsi_disk(disk):
-            return any(target.getAttribute('bus') == 'scsi' for target in
-                       disk.getElementsByTagName('target'))
+        def get_xml():
+            return self.libvirt_connection.lookupByName(node_name).XMLDesc(0)
 
-        all_disks = minidom.parseString(node.XMLDesc()).getElementsByTagName('disk')
+        if not self._events.is_listening:
+            # Without events nothing tells the cache about changes made outside of this controller
+            return DomainDescriptor(get_xml())
+        return self._descriptors.get(node_name, get_xml)
 
-        return [disk for disk in all_disks if is_scsi_disk(disk)]
+    def _get_inactive_descriptor(self, node_name) -> DomainDescriptor:
+        """
+        :return: The parsed persistent XML description of the node, always fetched, that can be changed and
+                 passed to defineXML without carrying over live-only state
+        """
+        node = self.libvirt_connection.lookupByName(node_name)
+        return DomainDescriptor(node.XMLDesc(libvirt.VIR_DOMAIN_XML_INACTIVE))
+
+    def _get_all_scsi_disks(self, node_name):
+        """
+        :return: All node disks that use an SCSI bus (/dev/sd*)
+        """
+        return self._get_descriptor(node_name).scsi_disks
 
     @staticmethod
     def _get_disk_source_file(disk):
-        sources = disk.getElementsByTagName('source')
+        sources = disk.findall('source')
 
         assert len(sources) in (0, 1), f"A disk must have either 0 or 1 sources, {sources}"
 
         if len(sources) == 0:
             return None
 
-        return sources[0].getAttribute('file')
+        return sources[0].get('file')
 
     @staticmethod
     def _get_disk_alias(disk):
-        aliases = disk.getElementsByTagName('alias')
+        aliases = disk.findall('alias')
 
         assert len(aliases) in (0, 1), f"A disk must have either 0 or 1 aliases, {aliases}"
 
         if len(aliases) == 0:
             return None
 
-        return aliases[0].getAttribute('name')
+        return aliases[0].get('name')
 
-    @classmethod
-    def _get_attached_test_disks(cls, node):
+    def _get_attached_test_disks(self, node_name):
         """
         :return: Returns all disks created by `self.attach_test_disk` by examining the alias of all SCSI disks
         """
         def is_test_disk(disk):
-            return any(alias.getAttribute('name').startswith(cls.TEST_DISKS_PREFIX) for alias in
-                       disk.getElementsByTagName('alias'))
+            return any(alias.get('name', '').startswith(self.TEST_DISKS_PREFIX) for alias in disk.findall('alias'))
 
-        all_scsi_disks = cls._get_all_scsi_disks(node)
+        all_scsi_disks = self._get_all_scsi_disks(node_name)
 
         return [disk for disk in all_scsi_disks if is_test_disk(disk)]
 
-    @staticmethod
-    def _get_disk_scsi_identifier(disk):
+    @classmethod
+    def create_test_disk(cls, disk_size, bootable=False):
         """
-        :return: Returns `b` if, for example, the disks' target.dev is `sdb`
+        :return: The path of a new temporary disk with the given size
         """
-        target_elements = disk.getElementsByTagName('target')
-        assert len(target_elements) == 1, f"Disks shouldn't have multiple targets, {target_elements}"
-        target_element = target_elements[0]
+        with tempfile.NamedTemporaryFile() as f:
+            tmp_disk = f.name
 
-        return re.findall(r"^sd(.*)$", target_element.getAttribute('dev'))[0]
+        cls.create_disk(tmp_disk, disk_size)
 
-    def _get_available_scsi_identifier(self, node):
-        """
-        :return: Returns, for example, `d` if `sda`, `sdb`, `sdc`, `sde` are all already in use
-        """
-        identifiers_in_use = [self._get_disk_scsi_identifier(disk) for disk in self._get_all_scsi_disks(node)]
+        if bootable:
+            cls.add_disk_bootflag(tmp_disk)
 
-        try:
-            result = next(candidate for candidate in string.ascii_lowercase if candidate not in identifiers_in_use)
-        except StopIteration:
-            raise ValueError(f"Couldn't find available scsi disk letter, all are taken: {identifiers_in_use}")
+        return tmp_disk
 
-        return result
+    @staticmethod
+    def remove_test_disk(source_file):
+        assert source_file is not None, "A test disk has no source file. This should never happen"
+        assert source_file.startswith(
+            tempfile.gettempdir()), "File unexpectedly not in tmp, avoiding deletion to be on the safe side"
+        os.remove(source_file)
 
     def attach_test_disk(self, node_name, disk_size, bootable=False):
         """
@@ -203,41 +222,44 @@ class LibvirtController(NodeController, ABC):
         # We don't use `vd` virtio disks because libvirt overwrites our aliases if we do so, coming up with
         # its own `virtio-<num>` aliases instead. Those aliases allow us to identify disks created by this
         # function when we perform `detach_all_test_disks` for cleanup.
-        target_dev = f"sd{self._get_available_scsi_identifier(node)}"
+        target_dev = self._get_descriptor(node_name).get_available_scsi_dev()
         disk_alias = f"{self.TEST_DISKS_PREFIX}-{target_dev}"
 
-        with tempfile.NamedTemporaryFile() as f:
-            tmp_disk = f.name
-
-        self.create_disk(tmp_disk, disk_size)
+        tmp_disk = self.create_test_disk(disk_size, bootable)
 
-        if bootable:
-            self.add_disk_bootflag(tmp_disk)
-
-        node.attachDevice(f"""
+        node.attachDeviceFlags(f"""
             <disk type='file' device='disk'>
                 <alias name='{disk_alias}'/>
                 <driver name='qemu' type='qcow2'/>
                 <source file='{tmp_disk}'/>
                 <target dev='{target_dev}'/>
             </disk>
-        """)
+        """, self._get_device_flags(node))
+        self._descriptors.invalidate(node_name)
 
         return tmp_disk
 
+    @staticmethod
+    def _get_device_flags(node):
+        """
+        :return: Flags that make a device change both to the running node and to its definition, so it is
+                 still there after a restart, and edits of the definition see it
+        """
+        flags = libvirt.VIR_DOMAIN_AFFECT_CONFIG if node.isPersistent() else libvirt.VIR_DOMAIN_AFFECT_CURRENT
+        if node.isActive():
+            flags |= libvirt.VIR_DOMAIN_AFFECT_LIVE
+        return flags
+
     def detach_all_test_disks(self, node_name):
         node = self.libvirt_connection.lookupByName(node_name)
 
-        for test_disk in self._get_attached_test_disks(node):
+        for test_disk in self._get_attached_test_disks(node_name):
             alias = self._get_disk_alias(test_disk)
             assert alias is not None, "A test disk has no alias. This should never happen"
-            node.detachDeviceAlias(alias)
+            node.detachDeviceAlias(alias, self._get_device_flags(node))
+            self._descriptors.invalidate(node_name)
 
-            source_file = self._get_disk_source_file(test_disk)
-            assert source_file is not None, "A test disk has no source file. This should never happen"
-            assert source_file.startswith(
-                tempfile.gettempdir()), "File unexpectedly not in tmp, avoiding deletion to be on the safe side"
-            os.remove(source_file)
+            self.remove_test_disk(self._get_disk_source_file(test_disk))
 
     def attach_interface(self, node_name, network_xml, target_interface=consts.TEST_TARGET_INTERFACE):
         """
@@ -287,8 +309,9 @@ class LibvirtController(NodeController, ABC):
             mac_addresses.append(lease['mac'])
         command = f"virsh attach-interface {node_name} network {network_name} --target {target_interface} --persistent"
         utils.run_command(command)
+        self._descriptors.invalidate(node_name)
         try:
-            waiting.wait(
+            libvirt_events.wait(
                     lambda: len(self.list_leases(network_name)) > len(mac_addresses),
                     timeout_seconds=30,
                     sleep_seconds=2,
@@ -311,6 +334,7 @@ class LibvirtController(NodeController, ABC):
         logging.info(f"Undefining an interface mac: {mac}, for node: {node_name}")
         command = f"virsh detach-interface {node_name} --type network --mac {mac}"
         utils.run_command(command, True)
+        self._descriptors.invalidate(node_name)
         logging.info(f"Successfully removed interface.")
 
     def restart_node(self, node_name):
@@ -322,8 +346,7 @@ class LibvirtController(NodeController, ABC):
         logging.info("Formatting all the disks")
         nodes = self.list_nodes()
 
-        for node in nodes:
-            self.format_node_disk(node.name())
+        self._run_on_nodes(self.format_node_disk, nodes)
 
     def prepare_nodes(self):
         self.destroy_all_nodes()
@@ -332,6 +355,7 @@ class LibvirtController(NodeController, ABC):
         logging.info("Delete all the nodes")
         self.shutdown_all_nodes()
         self.format_all_node_disks()
+        self._descriptors.invalidate()
 
     def is_active(self, node_name):
         node = self.libvirt_connection.lookupByName(node_name)
@@ -364,7 +388,7 @@ class LibvirtController(NodeController, ABC):
 
     def _wait_till_domain_has_ips(self, domain, timeout=360, interval=5):
         logging.info("Waiting till host %s will have ips", domain.name())
-        waiting.wait(
+        libvirt_events.wait(
             lambda: len(self._get_domain_ips(domain)) > 0,
             timeout_seconds=timeout,
             sleep_seconds=interval,
@@ -375,66 +399,72 @@ class LibvirtController(NodeController, ABC):
     def set_boot_order(self, node_name, cd_first=False):
         logging.info(f"Going to set the following boot order: cd_first: {cd_first}, "
                      f"for node: {node_name}")
-        node = self.libvirt_connection.lookupByName(node_name)
-        current_xml = node.XMLDesc(0)
-        # Creating XML obj
-        xml = minidom.parseString(current_xml.encode('utf-8'))
-        os_element = xml.getElementsByTagName('os')[0]
-        # Delete existing boot elements
-        for el in os_element.getElementsByTagName('boot'):
-            dev = el.getAttribute('dev')
-            if dev in ['cdrom', 'hd']:
-                os_element.removeChild(el)
-            else:
-                raise ValueError(f'Found unexpected boot device: \'{dev}\'')
-        # Set boot elements for hd and cdrom
-        first = xml.createElement('boot')
-        first.setAttribute('dev', 'cdrom' if cd_first else 'hd')
-        os_element.appendChild(first)
-        second = xml.createElement('boot')
-        second.setAttribute('dev', 'hd' if cd_first else 'cdrom')
-        os_element.appendChild(second)
+        descriptor = self._get_inactive_descriptor(node_name)
+        descriptor.set_boot_order(cd_first)
         # Apply new machine xml
-        dom = self.libvirt_connection.defineXML(xml.toprettyxml())
+        dom = self._define_xml(node_name, descriptor.to_xml())
         if dom is None:
             raise Exception(f"Failed to set boot order cdrom first: {cd_first}, "
                             f"for node: {node_name}")
         logging.info(f"Boot order set successfully: cdrom first: {cd_first}, "
                      f"for node: {node_name}")
 
+    def _define_xml(self, node_name, xml):
+        try:
+            return self.libvirt_connection.defineXML(xml)
+        finally:
+            self._descriptors.invalidate(node_name)
+
     def get_host_id(self, node_name):
         dom = self.libvirt_connection.lookupByName(node_name)
         return dom.UUIDString()
 
     def get_cpu_cores(self, node_name):
-        xml = self._get_xml(node_name)
-        vcpu_element = xml.getElementsByTagName('vcpu')[0]
-        return int(vcpu_element.firstChild.nodeValue)
+        return self._get_descriptor(node_name).vcpu
 
     def set_cpu_cores(self, node_name, core_count):
         logging.info(f"Going to set vcpus to {core_count} for node: {node_name}")
         dom = self.libvirt_connection.lookupByName(node_name)
-        dom.setVcpusFlags(core_count)
+        try:
+            dom.setVcpusFlags(core_count)
+        finally:
+            self._descriptors.invalidate(node_name)
         logging.info(f"Successfully set vcpus to {core_count} for node: {node_name}")
 
     def get_ram_kib(self, node_name):
-        xml = self._get_xml(node_name)
-        memory_element = xml.getElementsByTagName('currentMemory')[0]
-        return int(memory_element.firstChild.nodeValue)
+        return self._get_descriptor(node_name).current_memory_kib
 
     def set_ram_kib(self, node_name, ram_kib):
         logging.info(f"Going to set memory to {ram_kib} for node: {node_name}")
-        xml = self._get_xml(node_name)
-        memory_element = xml.getElementsByTagName('memory')[0]
-        memory_element.firstChild.replaceWholeText(ram_kib)
-        current_memory_element = xml.getElementsByTagName('currentMemory')[0]
-        current_memory_element.firstChild.replaceWholeText(ram_kib)
-        dom = self.libvirt_connection.defineXML(xml.toprettyxml())
+        descriptor = self._get_inactive_descriptor(node_name)
+        descriptor.set_memory_kib(ram_kib)
+        dom = self._define_xml(node_name, descriptor.to_xml())
         if dom is None:
             raise Exception(f"Failed to set memory for node: {node_name}")
         logging.info(f"Successfully set memory to {ram_kib} for node: {node_name}")
 
-    def _get_xml(self, node_name):
-        dom = self.libvirt_connection.lookupByName(node_name)
-        current_xml = dom.XMLDesc(0)
-        return minidom.parseString(current_xml.encode('utf-8'))
+    def edit(self, node_name, start=None) -> DomainEdit:
+        return DomainEdit(self, node_name, start)
+
+    def commit_edit(self, edit: DomainEdit):
+        """
+        Applies all the edits to the node definition with a single defineXML. The node is shut down
+        before if it is running, and is started after if requested by the edit or if it was running.
+        """
+        if not edit:
+            return
+
+        logging.info("Going to apply edits to node: %s", edit.node_name)
+        was_active = self.is_active(edit.node_name)
+        if was_active:
+            self.shutdown_node(edit.node_name)
+
+        descriptor = self._get_inactive_descriptor(edit.node_name)
+        edit.apply(descriptor)
+        dom = self._define_xml(edit.node_name, descriptor.to_xml())
+        if dom is None:
+            raise Exception(f"Failed to apply edits for node: {edit.node_name}")
+        logging.info("Successfully applied edits to node: %s", edit.node_name)
+
+        if edit.start if edit.start is not None else was_active:
+            self.start_node(edit.node_name, check_ips=True)
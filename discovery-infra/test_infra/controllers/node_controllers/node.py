@@ -9,8 +9,8 @@ class Node:
         self.private_ssh_key_path = private_ssh_key_path
         self.username = username
         self.node_controller = node_controller
-        self.original_vcpu_count = self.get_cpu_cores()
-        self.original_ram_kib = self.get_ram_kib()
+        self._original_vcpu_count = None
+        self._original_ram_kib = None
         self._ips = []
         self._macs = []
 
@@ -21,6 +21,18 @@ class Node:
     def is_active(self):
         return self.node_controller.is_active(self.name)
 
+    @property
+    def original_vcpu_count(self):
+        if self._original_vcpu_count is None:
+            self._original_vcpu_count = self.get_cpu_cores()
+        return self._original_vcpu_count
+
+    @property
+    def original_ram_kib(self):
+        if self._original_ram_kib is None:
+            self._original_ram_kib = self.get_ram_kib()
+        return self._original_ram_kib
+
     def is_master_in_name(self):
         return consts.NodeRoles.MASTER in self.name
 
@@ -114,10 +126,14 @@ class Node:
 
     def set_boot_order_flow(self, cd_first=False, start=True):
         logging.info("Setting boot order , cd_first=%s, start=%s", cd_first, start)
-        self.shutdown()
-        self.set_boot_order(cd_first)
-        if start:
-            self.start()
+        with self.edit(start=start) as edit:
+            edit.set_boot_order(cd_first)
+
+    def edit(self, start=None):
+        # The original values are read before the edit can change them, so that reset_cpu_cores and
+        # reset_ram_kib can restore them afterwards
+        _ = self.original_vcpu_count, self.original_ram_kib
+        return self.node_controller.edit(self.name, start)
 
     def get_host_id(self):
         return self.node_controller.get_host_id(self.name)
@@ -126,6 +142,8 @@ class Node:
         return self.node_controller.get_cpu_cores(self.name)
 
     def set_cpu_cores(self, core_count):
+        # The original count is read before it is changed, so that reset_cpu_cores can restore it
+        _ = self.original_vcpu_count
         self.node_controller.set_cpu_cores(self.name, core_count)
 
     def reset_cpu_cores(self):
@@ -135,6 +153,8 @@ class Node:
         return self.node_controller.get_ram_kib(self.name)
 
     def set_ram_kib(self, ram_kib):
+        # The original amount is read before it is changed, so that reset_ram_kib can restore it
+        _ = self.original_ram_kib
         self.node_controller.set_ram_kib(self.name, ram_kib)
 
     def reset_ram_kib(self):
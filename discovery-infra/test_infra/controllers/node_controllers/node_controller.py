@@ -23,6 +23,10 @@ class NodeController(ABC):
 
     @abstractmethod
     def shutdown_all_nodes(self) -> None:
+        """
+        Runs on all the nodes concurrently. If a single node fails its error is raised as is, if several
+        nodes fail a ConcurrentJobsError is raised, that holds the error of every failed node by name
+        """
         pass
 
     @abstractmethod
@@ -31,6 +35,10 @@ class NodeController(ABC):
 
     @abstractmethod
     def start_all_nodes(self) -> List[Node]:
+        """
+        Runs on all the nodes concurrently. If a single node fails its error is raised as is, if several
+        nodes fail a ConcurrentJobsError is raised, that holds the error of every failed node by name
+        """
         pass
 
     @abstractmethod
@@ -43,6 +51,10 @@ class NodeController(ABC):
 
     @abstractmethod
     def format_all_node_disks(self) -> None:
+        """
+        Runs on all the nodes concurrently. If a single node fails its error is raised as is, if several
+        nodes fail a ConcurrentJobsError is raised, that holds the error of every failed node by name
+        """
         pass
 
     @abstractmethod
@@ -68,6 +80,10 @@ class NodeController(ABC):
 
     @abstractmethod
     def destroy_all_nodes(self) -> None:
+        """
+        Shuts down all the nodes and formats their disks, see `shutdown_all_nodes` for the errors raised
+        when it fails on several nodes
+        """
         pass
 
     @abstractmethod
@@ -90,6 +106,16 @@ class NodeController(ABC):
     def set_boot_order(self, node_name, cd_first=False) -> None:
         pass
 
+    @abstractmethod
+    def edit(self, node_name: str, start: bool = None):
+        """
+        Returns an edit of the node definition, to which boot order, memory, vcpus, disks and interfaces
+        changes can be added, and that applies all of them at once, with at most one power cycle, on commit
+        :param node_name: Node to edit
+        :param start: Whether to start the node after the commit, by default only if it was running
+        """
+        pass
+
     @abstractmethod
     def get_node_ips_and_macs(self, node_name) -> Tuple[List[str], List[str]]:
         pass
@@ -84,6 +84,8 @@ class TerraformController(LibvirtController):
         self._fill_tfvars()
         logging.info('Start running terraform')
         self.tf.apply()
+        # The domains may have been recreated under the names of the cached ones
+        self._descriptors.invalidate()
         if self.params.running:
             utils.wait_till_nodes_are_ready(
                 nodes_count=self.params.worker_count + self.params.master_count,
@@ -219,6 +221,7 @@ class TerraformController(LibvirtController):
             self.params.libvirt_network_name,
             self.params.libvirt_secondary_network_name
         )
+        self._descriptors.invalidate()
         if delete_tf_folder:
             logging.info('Deleting %s', self.tf_folder)
             shutil.rmtree(self.tf_folder)
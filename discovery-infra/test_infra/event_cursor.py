@@ -0,0 +1,110 @@
+import datetime
+import threading
+import time
+from bisect import bisect_left
+from typing import Iterable, List, Optional
+
+
+class _IndexedEvent:
+    __slots__ = ("event", "message", "time")
+
+    def __init__(self, event: dict):
+        self.event = event
+        self.message = event["message"]
+        # Same as utils.to_utc, which can't be imported here as utils depends on the cluster watcher
+        self.time = time.mktime(datetime.datetime.strptime(event["event_time"], "%Y-%m-%dT%H:%M:%S.%fZ").timetuple())
+
+
+def _get_key(event: dict):
+    return event["event_time"], event["message"]
+
+
+def _get_whole_tokens(text: str) -> List[str]:
+    # The first and last tokens of a substring may be cut in the middle of a message word,
+    # only the ones between them are guaranteed to be whole words of a matching message
+    return text.split()[1:-1]
+
+
+class EventCursor:
+    """
+    Incremental view of the events of a cluster (or of one of its hosts). Each update only processes
+    the events that were added since the previous one, parsing their time once and indexing their
+    message by whitespace separated tokens, so lookups don't rescan the whole event list.
+    """
+
+    def __init__(self, client, cluster_id, host_id=''):
+        self.client = client
+        self.cluster_id = cluster_id
+        self.host_id = host_id
+        self._events: List[_IndexedEvent] = []
+        self._times: List[float] = []
+        self._tokens = {}
+        self._keys = set()
+        self._ordered = True
+        self._received = 0
+        self._last_key = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._events)
+
+    def update(self) -> List[dict]:
+        """Fetches the events and returns the ones that were not seen before, in the order they were received"""
+        events = self.client.get_events(cluster_id=self.cluster_id, host_id=self.host_id)
+
+        with self._lock:
+            # Events are only ever appended, so the list normally picks up where the last one ended
+            if 0 < self._received <= len(events) and _get_key(events[self._received - 1]) == self._last_key:
+                new_events = events[self._received:]
+            else:
+                new_events = [event for event in events if _get_key(event) not in self._keys]
+
+            for event in new_events:
+                self._add(event)
+            self._received = len(events)
+            self._last_key = _get_key(events[-1]) if events else None
+
+        return new_events
+
+    def _add(self, event: dict):
+        indexed = _IndexedEvent(event)
+        if self._times and indexed.time < self._times[-1]:
+            self._ordered = False
+
+        position = len(self._events)
+        self._events.append(indexed)
+        self._times.append(indexed.time)
+        self._keys.add(_get_key(event))
+        for token in set(indexed.message.split()):
+            self._tokens.setdefault(token, []).append(position)
+
+    def get_events(self, after: int = 0) -> List[dict]:
+        """Returns the seen events, starting from position `after`"""
+        with self._lock:
+            return [indexed.event for indexed in self._events[after:]]
+
+    def find(self, event_to_find: str, since: float = 0, params_list: Iterable[str] = (), after: int = 0) -> Optional[dict]:
+        """
+        Returns the first event whose message contains `event_to_find` and all of `params_list`, among
+        the ones that happened at `since` or later and were seen at position `after` or later
+        """
+        with self._lock:
+            start = max(after, bisect_left(self._times, since) if self._ordered else 0)
+            candidates = None
+            for text in (event_to_find, *params_list):
+                for token in _get_whole_tokens(text):
+                    positions = self._tokens.get(token, [])
+                    if candidates is None or len(positions) < len(candidates):
+                        candidates = positions
+            if candidates is None:
+                candidates = range(start, len(self._events))
+            else:
+                candidates = candidates[bisect_left(candidates, start):]
+
+            for position in candidates:
+                indexed = self._events[position]
+                if indexed.time < since:
+                    continue
+                if event_to_find in indexed.message and all(param in indexed.message for param in params_list):
+                    return indexed.event
+        return None
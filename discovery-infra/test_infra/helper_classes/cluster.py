@@ -1,12 +1,9 @@
 import logging
 import random
 import yaml
-import json
-import time
 import ipaddress
 import contextlib
 from typing import List
-import requests
 from collections import Counter
 
 import waiting
@@ -15,7 +12,12 @@ from assisted_service_client import models
 
 from tests.conftest import env_variables
 from test_infra import consts, utils
-from test_infra.tools import static_ips
+from test_infra.cluster_watcher import ClusterStateWatcher, StabilityWindow
+from test_infra.event_cursor import EventCursor
+from test_infra.host_inventory import get_host_view
+from test_infra.install_timeline import InstallTimeline
+from test_infra.install_watchdog import InstallWatchdog
+from test_infra.tools import static_ips, connection_pool
 
 
 class Cluster:
@@ -33,6 +35,13 @@ class Cluster:
                                    user_managed_networking=user_managed_networking, high_availability_mode=high_availability_mode).id
             self.name = cluster_name
 
+        watcher = ClusterStateWatcher.get(self.api_client, self.id)
+        # The cluster events cursor is shared with the watcher, which may use it as a change feed
+        self._event_cursors = {'': watcher.event_cursor}
+        # Shared by all the Cluster objects of this cluster, so that only one of each observes it
+        self.timeline = watcher.get_observer("timeline", lambda: InstallTimeline(self.id))
+        self.watchdog = watcher.get_observer("watchdog", lambda: InstallWatchdog(watcher, watcher.event_cursor))
+
     def _create(self,
                 cluster_name,
                 additional_ntp_source,
@@ -234,7 +243,13 @@ class Cluster:
         self.api_client.set_cluster_proxy(self.id, http_proxy, https_proxy, no_proxy)
 
     def start_install(self):
-        self.api_client.install_cluster(cluster_id=self.id)
+        # Armed first, so that the events sent as soon as the installation starts are checked too
+        self.watchdog.arm()
+        try:
+            self.api_client.install_cluster(cluster_id=self.id)
+        except BaseException:
+            self.watchdog.disarm()
+            raise
 
     def wait_for_installing_in_progress(self, nodes_count=1):
         utils.wait_till_at_least_one_host_is_in_status(
@@ -352,6 +367,7 @@ class Cluster:
         self.api_client.deregister_host(cluster_id=self.id, host_id=host_id)
 
     def cancel_install(self):
+        self.watchdog.disarm()
         self.api_client.cancel_cluster_install(cluster_id=self.id)
 
     def get_bootstrap_hostname(self):
@@ -367,7 +383,9 @@ class Cluster:
         for host in hosts:
             if host["role"] == role:
                 nodes_by_role.append(host)
-        logging.info(f"Found hosts: {nodes_by_role}, that has the role: {role}")
+        utils.status_log.info(("hosts_by_role", self.id, role), [host["id"] for host in nodes_by_role],
+                              "Found hosts: %s, that has the role: %s",
+                              [host.get("requested_hostname") or host["id"] for host in nodes_by_role], role)
         return nodes_by_role
 
     def get_random_host_by_role(self, role):
@@ -408,20 +426,28 @@ class Cluster:
         )
 
     def wait_for_ready_to_install(self):
-        utils.wait_till_cluster_is_in_status(
-            client=self.api_client,
-            cluster_id=self.id,
-            statuses=[consts.ClusterStatus.READY],
-            timeout=consts.READY_TIMEOUT
-        )
-        # This code added due to BZ:1909997, temporarily checking if help to prevent unexpected failure
-        time.sleep(90)
-        utils.wait_till_cluster_is_in_status(
-            client=self.api_client,
-            cluster_id=self.id,
-            statuses=[consts.ClusterStatus.READY],
-            timeout=consts.READY_TIMEOUT
-        )
+        statuses = [consts.ClusterStatus.READY]
+        logging.info("Wait till cluster %s is stable in status %s", self.id, statuses)
+        # Waiting for the status to settle was added due to BZ:1909997, the cluster may leave ready
+        # right after reaching it
+        watcher = ClusterStateWatcher.get(self.api_client, self.id)
+        try:
+            watcher.wait(
+                StabilityWindow(
+                    lambda snapshot: utils.is_cluster_snapshot_in_status(snapshot, statuses),
+                    observations=consts.READY_STABLE_OBSERVATIONS,
+                    quiet_seconds=consts.READY_QUIET_SECONDS,
+                    event_cursor=self.get_event_cursor(),
+                    min_seconds=consts.READY_STABLE_MIN_SECONDS,
+                    clock=watcher.clock,
+                ),
+                timeout_seconds=consts.READY_TIMEOUT,
+                sleep_seconds=5,
+                waiting_for="Cluster to be stable in status %s" % statuses,
+            )
+        except:
+            logging.error("Cluster status is: %s", watcher.get_snapshot().status)
+            raise
 
     def is_in_cancelled_status(self):
         return utils.is_cluster_in_status(
@@ -445,6 +471,7 @@ class Cluster:
         )
 
     def reset_install(self):
+        self.watchdog.disarm()
         self.api_client.reset_cluster_install(cluster_id=self.id)
 
     def is_in_insufficient_status(self):
@@ -575,15 +602,12 @@ class Cluster:
         logging.info(f"Wait until cluster %s validation %s is in status %s",
             self.id, validation_id, statuses)
         try:
-            waiting.wait(
-                lambda: self.is_cluster_validation_in_status(
-                    validation_section=validation_section,
-                    validation_id=validation_id,
-                    statuses=statuses
-                ),
+            ClusterStateWatcher.get(self.api_client, self.id).wait(
+                lambda snapshot: snapshot.get_validation_status(None, validation_section, validation_id) in statuses,
                 timeout_seconds=timeout,
                 sleep_seconds=interval,
                 waiting_for="Cluster validation to be in status %s" % statuses,
+                expected_exceptions=Exception,
             )
         except:
             logging.error("Cluster validation status is: %s",
@@ -611,16 +635,12 @@ class Cluster:
         logging.info("Wait until host %s validation %s is in status %s", host_id,
             validation_id, statuses)
         try:
-            waiting.wait(
-                lambda: self.is_host_validation_in_status(
-                    host_id=host_id,
-                    validation_section=validation_section,
-                    validation_id=validation_id,
-                    statuses=statuses
-                ),
+            ClusterStateWatcher.get(self.api_client, self.id).wait(
+                lambda snapshot: snapshot.get_validation_status(host_id, validation_section, validation_id) in statuses,
                 timeout_seconds=timeout,
                 sleep_seconds=interval,
                 waiting_for="Host validation to be in status %s" % statuses,
+                expected_exceptions=Exception,
             )
         except:
             logging.error("Host validation status is: %s",
@@ -628,6 +648,31 @@ class Cluster:
                 host_id, validation_section, validation_id))
             raise
 
+    def wait_for_validations(self, validations, timeout=consts.VALIDATION_TIMEOUT, interval=2):
+        """
+        Waits in a single loop until every validation is in one of its statuses. `validations` maps
+        (host_id, validation_section, validation_id) to the expected statuses, with a host_id of None
+        for cluster validations.
+        """
+        logging.info("Wait until cluster %s validations are in status: %s", self.id, validations)
+        watcher = ClusterStateWatcher.get(self.api_client, self.id)
+
+        def get_pending(snapshot):
+            current = {validation: snapshot.get_validation_status(*validation) for validation in validations}
+            return {validation: status for validation, status in current.items()
+                    if status not in validations[validation]}
+
+        try:
+            watcher.wait(
+                lambda snapshot: not get_pending(snapshot),
+                timeout_seconds=timeout,
+                sleep_seconds=interval,
+                waiting_for="Validations to be in status %s" % validations,
+            )
+        except:
+            logging.error("Validations not in the expected status: %s", get_pending(watcher.get_snapshot()))
+            raise
+
     def is_host_validation_in_status(
             self, host_id, validation_section, validation_id, statuses
     ):
@@ -667,48 +712,56 @@ class Cluster:
     def get_events(self, host_id=''):
         return self.api_client.get_events(cluster_id=self.id, host_id=host_id)
 
-    def _find_event(self, event_to_find, reference_time, params_list, host_id):
-        events_list = self.get_events(host_id=host_id)
-        for event in events_list:
-            if event_to_find in event['message']:
-                # Adding a 2 sec buffer to account for a small time diff between the machine and the time on staging
-                if utils.to_utc(event['event_time']) >= reference_time-2:
-                    if all(param in event['message'] for param in params_list):
-                        event_exist = True
-                        logging.info(f"Event to find: {event_to_find} exists with its params")
-                        return True
-        else:
-            return False
+    def get_event_cursor(self, host_id=''):
+        if host_id not in self._event_cursors:
+            self._event_cursors[host_id] = EventCursor(self.api_client, self.id, host_id)
+        return self._event_cursors[host_id]
+
+    def _find_event(self, event_to_find, reference_time, params_list, host_id, after=0):
+        # Adding a 2 sec buffer to account for a small time diff between the machine and the time on staging
+        event = self.get_event_cursor(host_id).find(event_to_find, reference_time - 2, params_list, after=after)
+        if event is not None:
+            logging.info(f"Event to find: {event_to_find} exists with its params")
+            return True
+        return False
 
     def wait_for_event(self, event_to_find, reference_time, params_list=[], host_id='', timeout=10):
-        logging.info(f"Searching for event: {event_to_find}")
+        self.wait_for_events([event_to_find], reference_time, params_list, host_id, timeout)
+
+    def wait_for_events(self, events_to_find, reference_time, params_list=[], host_id='', timeout=10):
+        logging.info(f"Searching for events: {events_to_find}")
+        cursor = self.get_event_cursor(host_id)
+        remaining = list(events_to_find)
+        # All the known events are searched once, later polls only search the new ones
+        checked = 0
+
+        def find_remaining_events():
+            nonlocal checked
+            cursor.update()
+            # Read before searching: the cursor may be shared and updated by other threads meanwhile,
+            # events they add after this point are searched by the next poll
+            seen = len(cursor)
+            for event_to_find in list(remaining):
+                if self._find_event(event_to_find, reference_time, params_list, host_id, after=checked):
+                    remaining.remove(event_to_find)
+            checked = seen
+            return not remaining
+
         try:
-            waiting.wait(
-                lambda: self._find_event(
-                    event_to_find,
-                    reference_time,
-                    params_list,
-                    host_id
-                ),
+            utils.wait(
+                find_remaining_events,
                 timeout_seconds=timeout,
                 sleep_seconds=2,
-                waiting_for="Event: %s" % event_to_find,
+                waiting_for="Events: %s" % events_to_find,
+                clock=utils.get_clock(self.api_client),
             )
         except waiting.exceptions.TimeoutExpired:
-            logging.error(f"Event: {event_to_find} did't found")
+            logging.error(f"Events: {remaining} did't found")
             raise
 
     @staticmethod
     def get_inventory_host_nics_data(host: dict, ipv4_first=True):
-        def get_network_interface_ip(interface):
-            addresses = interface.ipv4_addresses + interface.ipv6_addresses if ipv4_first else \
-                interface.ipv6_addresses + interface.ipv4_addresses
-            return addresses[0].split("/")[0] if len(addresses) > 0 else None
-
-        inventory = models.Inventory(**json.loads(host["inventory"]))
-        interfaces_list = [models.Interface(**interface) for interface in inventory.interfaces]
-        return [{'name': interface.name, 'model': interface.product, 'mac': interface.mac_address,
-                 'ip': get_network_interface_ip(interface), 'speed': interface.speed_mbps} for interface in interfaces_list]
+        return get_host_view(host).get_nics_data(ipv4_first=ipv4_first)
 
     @staticmethod
     def get_ip_for_single_node(client, cluster_id, machine_cidr, ipv4_first=True):
@@ -726,7 +779,7 @@ class Cluster:
     def get_host_disks(self, host, filter=None):
         hosts = self.get_hosts()
         selected_host = [h for h in hosts if h["id"] == host["id"]]
-        disks = json.loads(selected_host[0]["inventory"])["disks"]
+        disks = get_host_view(selected_host[0]).disks
         if not filter:
             return [disk for disk in disks]
         else:
@@ -758,10 +811,11 @@ class Cluster:
 
     def _wait_for_api_vip(self, hosts, timeout=180):
         """Enable some grace time for waiting for API's availability."""
-        return waiting.wait(lambda: self.get_kube_api_ip(hosts=hosts),
-                            timeout_seconds=timeout,
-                            sleep_seconds=5,
-                            waiting_for="API's IP")
+        return utils.wait(lambda: self.get_kube_api_ip(hosts=hosts),
+                          timeout_seconds=timeout,
+                          sleep_seconds=5,
+                          waiting_for="API's IP",
+                          clock=utils.get_clock(self.api_client))
 
     @staticmethod
     def is_kubeapi_service_ready(ip_or_dns):
@@ -773,9 +827,9 @@ class Cluster:
                 ip_or_dns = f"[{ip_or_dns}]"
 
         try:
-            response = requests.get(f'https://{ip_or_dns}:6443/readyz',
-                                    verify=False,
-                                    timeout=1)
+            response = connection_pool.get_session().get(f'https://{ip_or_dns}:6443/readyz',
+                                                         verify=False,
+                                                         timeout=1)
             return response.ok
         except:
             return False
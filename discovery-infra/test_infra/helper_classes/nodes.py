@@ -1,5 +1,4 @@
 import logging
-import json
 from typing import Dict, Iterator, List
 import random
 
@@ -7,6 +6,7 @@ import waiting
 from munch import Munch
 from test_infra.controllers.node_controllers.node_controller import NodeController
 from test_infra import utils
+from test_infra.host_inventory import get_host_view
 from tests.conftest import env_variables
 from test_infra.controllers.node_controllers.node import Node
 from test_infra.tools.concurrently import run_concurrently
@@ -156,8 +156,7 @@ class Nodes:
         return mapping[node.name].cluster_host
 
     def get_cluster_hostname(self, cluster_host_object):
-        inventory = json.loads(cluster_host_object["inventory"])
-        return inventory["hostname"]
+        return get_host_view(cluster_host_object).hostname
 
     def set_hostnames(self, cluster):
         ipv6 = env_variables.get('ipv6')
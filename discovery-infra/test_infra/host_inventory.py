@@ -0,0 +1,70 @@
+import json
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+
+HOST_VIEWS_CACHE_SIZE = 1024
+
+_views_cache = OrderedDict()
+_views_cache_lock = threading.Lock()
+
+
+class HostInterface:
+    __slots__ = ("name", "product", "mac_address", "ipv4_addresses", "ipv6_addresses", "speed_mbps")
+
+    def __init__(self, interface: dict):
+        self.name = interface.get("name")
+        self.product = interface.get("product")
+        self.mac_address = interface.get("mac_address", "")
+        self.ipv4_addresses = interface.get("ipv4_addresses") or []
+        self.ipv6_addresses = interface.get("ipv6_addresses") or []
+        self.speed_mbps = interface.get("speed_mbps")
+
+    def get_ip(self, ipv4_first=True) -> Optional[str]:
+        addresses = self.ipv4_addresses + self.ipv6_addresses if ipv4_first else \
+            self.ipv6_addresses + self.ipv4_addresses
+        return addresses[0].split("/")[0] if len(addresses) > 0 else None
+
+
+class HostView:
+    """Parsed, read-only view of a host's inventory blob"""
+    __slots__ = ("id", "updated_at", "hostname", "interfaces", "disks", "macs")
+
+    def __init__(self, host: dict):
+        self.id = host["id"]
+        self.updated_at = host.get("updated_at")
+
+        inventory = json.loads(host.get("inventory") or "{}")
+        self.hostname = inventory.get("hostname")
+        self.interfaces: List[HostInterface] = [HostInterface(i) for i in inventory.get("interfaces", [])]
+        self.disks: List[dict] = inventory.get("disks", [])
+        self.macs = frozenset(interface.mac_address.lower() for interface in self.interfaces)
+
+    def has_mac(self, mac: str) -> bool:
+        return mac.lower() in self.macs
+
+    def get_nics_data(self, ipv4_first=True) -> List[dict]:
+        return [{'name': interface.name, 'model': interface.product, 'mac': interface.mac_address,
+                 'ip': interface.get_ip(ipv4_first), 'speed': interface.speed_mbps} for interface in self.interfaces]
+
+
+def get_host_view(host: dict) -> HostView:
+    """
+    Returns the parsed view of the given host, parsing its inventory at most once per (host id, updated_at).
+    Hosts without `updated_at` are keyed by their raw inventory instead.
+    """
+    updated_at = host.get("updated_at")
+    key = (host["id"], updated_at) if updated_at else (host["id"], host.get("inventory"))
+
+    with _views_cache_lock:
+        view = _views_cache.get(key)
+        if view is not None:
+            _views_cache.move_to_end(key)
+            return view
+
+    view = HostView(host)
+    with _views_cache_lock:
+        _views_cache[key] = view
+        if len(_views_cache) > HOST_VIEWS_CACHE_SIZE:
+            _views_cache.popitem(last=False)
+    return view
@@ -0,0 +1,105 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from tabulate import tabulate
+
+from logger import log
+
+
+class _Span:
+    def __init__(self, state, start):
+        self.state = state
+        self.start = start
+        self.end = start
+
+
+class InstallTimeline:
+    """
+    Every cluster status, host status and host installation stage observed on the snapshots of a
+    cluster, as consecutive spans per track (`cluster`, `<host> status`, `<host> stage`). A span
+    starts at the first snapshot showing its state and ends at the first one showing the next state,
+    so its accuracy is the poll interval. Only snapshots taken while something waits on the cluster
+    are observed.
+    """
+
+    def __init__(self, cluster_id):
+        self.cluster_id = cluster_id
+        self._tracks = OrderedDict()
+        self._lock = threading.Lock()
+
+    def observe(self, snapshot):
+        now = time.time()
+        current = [("cluster", "cluster", snapshot.status)]
+        for host in snapshot.hosts:
+            name = host.get("requested_hostname") or host["id"]
+            current.append((f"{name} status", "host status", host["status"]))
+            stage = (host.get("progress") or {}).get("current_stage")
+            if stage:
+                current.append((f"{name} stage", "host stage", stage))
+
+        with self._lock:
+            for track, kind, state in current:
+                spans = self._tracks.setdefault((track, kind), [])
+                if spans and spans[-1].state == state:
+                    spans[-1].end = now
+                else:
+                    if spans:
+                        spans[-1].end = now
+                    spans.append(_Span(state, now))
+
+    @property
+    def is_empty(self):
+        return not self._tracks
+
+    def _get_tracks(self):
+        with self._lock:
+            return [(track, kind, list(spans)) for (track, kind), spans in self._tracks.items()]
+
+    def to_chrome_trace(self):
+        """Returns the timeline in the Chrome trace event format, viewable in chrome://tracing or Perfetto"""
+        tracks = self._get_tracks()
+        started = min((spans[0].start for _, _, spans in tracks), default=0)
+        events = [{"name": "process_name", "ph": "M", "pid": 1, "args": {"name": f"cluster {self.cluster_id}"}}]
+        for tid, (track, kind, spans) in enumerate(tracks, start=1):
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": track}})
+            for span in spans:
+                events.append({
+                    "name": span.state,
+                    "cat": kind,
+                    "ph": "X",
+                    "pid": 1,
+                    "tid": tid,
+                    "ts": round((span.start - started) * 1e6),
+                    "dur": round((span.end - span.start) * 1e6),
+                })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def get_durations(self):
+        """Returns the durations in seconds spent in each state, keyed by (kind, state) in order of appearance"""
+        durations = OrderedDict()
+        for _, kind, spans in self._get_tracks():
+            for span in spans:
+                durations.setdefault((kind, span.state), []).append(span.end - span.start)
+        return durations
+
+    def get_durations_table(self):
+        rows = [
+            (kind, state, len(seconds), min(seconds), sum(seconds) / len(seconds), max(seconds))
+            for (kind, state), seconds in self.get_durations().items()
+        ]
+        return tabulate(rows, headers=["kind", "state", "count", "min [s]", "avg [s]", "max [s]"],
+                        floatfmt=".1f")
+
+    def export(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        trace_path = os.path.join(directory, f"install_timeline_{self.cluster_id}.json")
+        with open(trace_path, "w") as f:
+            json.dump(self.to_chrome_trace(), f)
+
+        table = self.get_durations_table()
+        with open(os.path.join(directory, f"install_timeline_{self.cluster_id}.txt"), "w") as f:
+            f.write(table + "\n")
+        log.info("Install timeline of cluster %s written to %s\n%s", self.cluster_id, trace_path, table)
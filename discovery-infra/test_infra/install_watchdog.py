@@ -0,0 +1,155 @@
+import os
+import threading
+import time
+from distutils.util import strtobool
+from typing import Optional
+
+from logger import log
+from test_infra import consts
+from test_infra.transition_stats import FINAL_STATES, TransitionStatsStore
+
+INSTALLATION_STATUSES = {
+    consts.ClusterStatus.PREPARING_FOR_INSTALLATION,
+    consts.ClusterStatus.INSTALLING,
+    consts.ClusterStatus.FINALIZING,
+}
+
+
+class InstallWatchdogError(Exception):
+    pass
+
+
+class InstallWatchdog:
+    """
+    Watches the snapshots of a cluster once its installation started, and aborts the pending waits on
+    it as soon as the installation can't succeed anymore: the cluster or a host failed, a validation
+    turned to failure while preparing the installation, a critical event was sent, or a host is stuck
+    in an installation stage for much longer than recorded by past runs.
+    """
+
+    def __init__(self, watcher, event_cursor, store: TransitionStatsStore = None):
+        self.watcher = watcher
+        self.event_cursor = event_cursor
+        self.store = store or watcher.get_stats_store()
+        self.enabled = strtobool(os.environ.get("INSTALL_WATCHDOG", "true"))
+        self._armed = False
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._validations = {}
+        self._events_checked_at = 0
+        self._events_count = None
+
+    def arm(self):
+        """Starts watching, only the events sent from now on are checked"""
+        if self.enabled:
+            try:
+                self.event_cursor.update()
+            except Exception:
+                log.exception("Failed to get cluster %s events", self.event_cursor.cluster_id)
+
+        with self._lock:
+            self._armed = self.enabled
+            self._stages = {}
+            self._validations = {}
+            self._events_checked_at = 0
+            self._events_count = len(self.event_cursor)
+
+    def disarm(self):
+        with self._lock:
+            self._armed = False
+
+    def observe(self, snapshot):
+        with self._lock:
+            if not self._armed:
+                return
+            problem = self.check(snapshot)
+            check_events = problem is None and self._is_events_check_due()
+
+        if check_events:
+            # Fetched without the lock, so that other publishes are not blocked meanwhile
+            try:
+                self.event_cursor.update()
+            except Exception:
+                log.exception("Failed to get cluster %s events", self.event_cursor.cluster_id)
+                return
+            with self._lock:
+                if not self._armed:
+                    return
+                problem = self._check_events()
+
+        if problem is None:
+            return
+
+        message = f"Install watchdog aborted the waits on cluster {self.watcher.cluster_id}: {problem}. " \
+                  f"Cluster status: {snapshot.status} ({snapshot.cluster.status_info}), hosts: " \
+                  f"{[self._describe_host(host) for host in snapshot.hosts]}"
+        # Waits that expect the failure are not aborted, stay armed for the ones that follow them
+        if self.watcher.abort(InstallWatchdogError(message)) > 0:
+            log.error(message)
+            self.disarm()
+
+    @staticmethod
+    def _describe_host(host):
+        stage = (host.get("progress") or {}).get("current_stage")
+        return (host.get("requested_hostname") or host["id"], host["status"], stage, host.get("status_info"))
+
+    def check(self, snapshot) -> Optional[str]:
+        if snapshot.status == consts.ClusterStatus.INSTALLED:
+            return None
+        if snapshot.status in (consts.ClusterStatus.ERROR, consts.ClusterStatus.CANCELLED):
+            return f"cluster is in status {snapshot.status}"
+
+        for host in snapshot.hosts:
+            if host["status"] == consts.NodesStatus.ERROR:
+                return f"host {self._describe_host(host)[0]} is in status {host['status']}"
+
+        return self._check_validations(snapshot) or self._check_stages(snapshot)
+
+    def _check_validations(self, snapshot) -> Optional[str]:
+        if snapshot.status not in INSTALLATION_STATUSES:
+            return None
+
+        for host_id, validations in snapshot.validations.items():
+            for validation, status in validations.items():
+                previous = self._validations.get((host_id, validation))
+                self._validations[(host_id, validation)] = status
+                if previous == "success" and status == "failure":
+                    owner = f"host {host_id}" if host_id else "cluster"
+                    return f"{owner} validation {validation[1]} turned to failure"
+        return None
+
+    def _check_stages(self, snapshot) -> Optional[str]:
+        now = time.monotonic()
+        for host in snapshot.hosts:
+            stage = (host.get("progress") or {}).get("current_stage")
+            previous = self._stages.get(host["id"])
+            if previous is None or previous[0] != stage:
+                self._stages[host["id"]] = (stage, now)
+                continue
+            if not stage or stage in FINAL_STATES["stage"]:
+                continue
+
+            durations = self.store.get_durations("stage", stage)
+            if len(durations) < consts.ADAPTIVE_POLL_MIN_SAMPLES:
+                continue
+            limit = max(max(durations) * consts.INSTALL_WATCHDOG_STAGE_FACTOR, consts.INSTALL_WATCHDOG_MIN_STAGE_SECONDS)
+            if now - previous[1] > limit:
+                return f"host {self._describe_host(host)[0]} is in stage {stage} for {now - previous[1]:.0f}s, " \
+                       f"recorded runs took at most {max(durations):.0f}s"
+        return None
+
+    def _is_events_check_due(self) -> bool:
+        now = time.monotonic()
+        if now - self._events_checked_at < consts.INSTALL_WATCHDOG_EVENTS_INTERVAL:
+            return False
+        self._events_checked_at = now
+        return True
+
+    def _check_events(self) -> Optional[str]:
+        """Checks the events the cursor received since the previous check, or since arm()"""
+        first = self._events_count
+        self._events_count = len(self.event_cursor)
+        for event in self.event_cursor.get_events(after=first):
+            if event.get("severity") == "critical":
+                return f"critical event: {event['message']}"
+        return None
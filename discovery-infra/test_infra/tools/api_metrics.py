@@ -0,0 +1,185 @@
+import atexit
+import functools
+import json
+import math
+import os
+import random
+import threading
+import time
+
+from logger import log
+from test_infra import consts
+
+_tls = threading.local()
+
+
+class EndpointStats:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.response_bytes = 0
+        self.total_seconds = 0.0
+        self.latencies = []
+        self.last_failed = False
+
+    def observe(self, seconds, response_bytes, failed):
+        if self.last_failed:
+            self.retries += 1
+        self.last_failed = failed
+
+        self.count += 1
+        self.errors += int(failed)
+        self.response_bytes += response_bytes
+        self.total_seconds += seconds
+        # Percentiles are computed from a bounded uniform sample of the latencies
+        if len(self.latencies) < consts.API_METRICS_MAX_SAMPLES:
+            self.latencies.append(seconds)
+        else:
+            index = random.randrange(self.count)
+            if index < consts.API_METRICS_MAX_SAMPLES:
+                self.latencies[index] = seconds
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+
+    def percentile(self, percent):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[max(0, math.ceil(percent / 100 * len(ordered)) - 1)]
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "retries": self.retries,
+            "response_bytes": self.response_bytes,
+            "total_seconds": round(self.total_seconds, 6),
+            "p50": round(self.percentile(50), 6),
+            "p95": round(self.percentile(95), 6),
+            "p99": round(self.percentile(99), 6),
+            "buckets": {str(bound): count for bound, count in zip(self.buckets, self.bucket_counts)},
+        }
+
+
+class ApiMetrics:
+    """
+    Per-endpoint statistics of assisted-service calls, keyed by HTTP method and templated resource
+    path (e.g. `GET /clusters/{cluster_id}`). A call is counted as a retry when the previous call to
+    the same endpoint failed.
+    """
+
+    def __init__(self, buckets=consts.API_METRICS_LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def observe(self, method, resource_path, seconds, response_bytes=0, failed=False):
+        key = f"{method} {resource_path}"
+        with self._lock:
+            if key not in self._endpoints:
+                self._endpoints[key] = EndpointStats(self.buckets)
+            self._endpoints[key].observe(seconds, response_bytes, failed)
+
+    def to_dict(self):
+        with self._lock:
+            return {key: stats.to_dict() for key, stats in sorted(self._endpoints.items())}
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=4)
+
+    def to_prometheus(self):
+        lines = [
+            "# TYPE assisted_api_request_duration_seconds histogram",
+            "# TYPE assisted_api_response_bytes_total counter",
+            "# TYPE assisted_api_errors_total counter",
+            "# TYPE assisted_api_retries_total counter",
+        ]
+        with self._lock:
+            for key, stats in sorted(self._endpoints.items()):
+                method, path = key.split(" ", 1)
+                labels = f'method="{method}",endpoint="{path}"'
+                for bound, count in zip(stats.buckets, stats.bucket_counts):
+                    lines.append(f'assisted_api_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'assisted_api_request_duration_seconds_bucket{{{labels},le="+Inf"}} {stats.count}')
+                lines.append(f'assisted_api_request_duration_seconds_sum{{{labels}}} {stats.total_seconds:.6f}')
+                lines.append(f'assisted_api_request_duration_seconds_count{{{labels}}} {stats.count}')
+                lines.append(f'assisted_api_response_bytes_total{{{labels}}} {stats.response_bytes}')
+                lines.append(f'assisted_api_errors_total{{{labels}}} {stats.errors}')
+                lines.append(f'assisted_api_retries_total{{{labels}}} {stats.retries}')
+        return "\n".join(lines) + "\n"
+
+    def dump(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        base_path = os.path.join(directory, f"api_metrics_{os.getpid()}")
+        with open(f"{base_path}.json", "w") as f:
+            f.write(self.to_json())
+        with open(f"{base_path}.prom", "w") as f:
+            f.write(self.to_prometheus())
+        log.info("API metrics written to %s.json and %s.prom", base_path, base_path)
+
+
+_metrics = ApiMetrics()
+
+
+def get_metrics() -> ApiMetrics:
+    return _metrics
+
+
+def _get_response_bytes(response):
+    if hasattr(response, "stream"):
+        # Unread urllib3 responses (_preload_content=False) are only known by their declared length
+        return int(response.getheader("content-length") or 0)
+    return len(response.data or b"")
+
+
+def instrument_api_client(api_client, metrics=None):
+    """
+    Wraps `call_api` of a swagger ApiClient so every request is recorded in `metrics`,
+    the process-wide registry by default. Response sizes are taken from the REST client responses
+    of the wrapped call.
+    """
+    metrics = metrics or _metrics
+    if getattr(api_client, "_api_metrics", None) is not None:
+        return
+    api_client._api_metrics = metrics
+
+    call_api = api_client.call_api
+    request = api_client.rest_client.request
+
+    @functools.wraps(request)
+    def counting_request(*args, **kwargs):
+        response = request(*args, **kwargs)
+        if getattr(_tls, "response_bytes", None) is not None:
+            _tls.response_bytes += _get_response_bytes(response)
+        return response
+
+    @functools.wraps(call_api)
+    def timed_call_api(resource_path, method, *args, **kwargs):
+        outer = getattr(_tls, "response_bytes", None)
+        _tls.response_bytes = 0
+        failed = True
+        started = time.perf_counter()
+        try:
+            result = call_api(resource_path, method, *args, **kwargs)
+            failed = False
+            return result
+        finally:
+            seconds = time.perf_counter() - started
+            metrics.observe(method, resource_path, seconds, _tls.response_bytes, failed)
+            _tls.response_bytes = outer
+
+    api_client.rest_client.request = counting_request
+    api_client.call_api = timed_call_api
+
+
+def _dump_at_exit():
+    directory = os.environ.get("API_METRICS_DIR")
+    if directory and _metrics.to_dict():
+        _metrics.dump(directory)
+
+
+atexit.register(_dump_at_exit)
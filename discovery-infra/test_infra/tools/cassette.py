@@ -0,0 +1,364 @@
+"""
+Record/replay of the HTTP exchanges of an InventoryClient.
+
+A cassette is a gzipped JSON-lines file with one line per request: the time it was sent relative to
+the start of the recording, the request key (method, path, query and Range header) and the response.
+Response bodies are stored once per content digest, so repeated polls of an unchanged resource only
+cost a reference.
+
+On replay no request reaches the network. The replaying client gets a virtual clock (`client.clock`)
+that only advances on its sleeps and by the recorded duration of each request, so the waits that
+follow it (the cluster watchers and utils.wait with utils.get_clock) replay in seconds. The `time`
+module itself is left untouched. Each
+request is answered with the latest recorded response for its key at or before the current virtual
+time.
+"""
+import atexit
+import base64
+import gzip
+import hashlib
+import io
+import json
+import tempfile
+import threading
+import time
+from bisect import bisect_right
+from urllib.parse import urlencode
+
+import urllib3
+from assisted_service_client.rest import ApiException, RESTResponse
+
+from logger import log
+from test_infra import consts
+
+_cassettes = {}
+_cassettes_lock = threading.Lock()
+
+
+class CassetteMissError(Exception):
+    pass
+
+
+def _get_key(method, path, query_params, headers):
+    query = urlencode(sorted(query_params or []))
+    return f"{method} {path}?{query} {(headers or {}).get('Range', '')}".rstrip()
+
+
+def _get_path(api_client, url):
+    host = api_client.configuration.host
+    return url[len(host):] if url.startswith(host) else url
+
+
+def _make_response(status, reason, headers, body, preload_content):
+    """Builds the response the swagger REST client would have returned, raising for error statuses"""
+    response = urllib3.HTTPResponse(
+        body=io.BytesIO(body) if isinstance(body, bytes) else _ZerosReader(body),
+        headers=headers,
+        status=status,
+        reason=reason,
+        preload_content=preload_content,
+    )
+    if preload_content:
+        response = RESTResponse(response)
+        response.data = response.data.decode('utf8')
+
+    if not 200 <= response.status <= 299:
+        raise ApiException(http_resp=response)
+    return response
+
+
+class _ZerosReader(io.RawIOBase):
+    """Replays bodies that were too large to record as zeros of the recorded size"""
+
+    def __init__(self, size):
+        super().__init__()
+        self._remaining = size
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        size = min(len(buffer), self._remaining)
+        buffer[:size] = bytes(size)
+        self._remaining -= size
+        return size
+
+
+class VirtualClock:
+    """
+    Stands in for the `time` module (time, monotonic and sleep) of a replaying client. Sleeping
+    advances the clock immediately instead of blocking.
+    """
+
+    def __init__(self, start_time):
+        self._start_time = start_time
+        self._now = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def now(self):
+        return self._now
+
+    def advance(self, seconds):
+        with self._lock:
+            self._now += max(0.0, seconds)
+
+    def time(self):
+        return self._start_time + self._now
+
+    def monotonic(self):
+        return self._now
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+        # Still yield the GIL so that other threads can make progress
+        time.sleep(0)
+
+
+class _Attachable:
+    """Keeps the original `request` of the REST clients it wraps, so that they can be restored"""
+
+    def __init__(self):
+        self._requests = {}
+
+    def _wrap(self, api_client, wrapper):
+        self._requests.setdefault(id(api_client), (api_client, api_client.rest_client.request))
+        api_client.rest_client.request = wrapper
+
+    def detach(self, api_client):
+        """Makes the given ApiClient send its requests to the network again"""
+        api_client, request = self._requests.pop(id(api_client), (api_client, None))
+        if request is not None:
+            api_client.rest_client.request = request
+
+    def close(self):
+        for api_client, _ in list(self._requests.values()):
+            self.detach(api_client)
+
+
+class _TeeResponse:
+    """
+    Unread urllib3 response that copies its body to a temporary file while it is consumed, and hands
+    it to `on_done(entry, body_file)` once the connection is released. The body never has to be held
+    in memory; only its first `max_body_size` bytes are kept, larger bodies are recorded by size.
+    """
+
+    def __init__(self, response, entry, max_body_size, on_done):
+        self._response = response
+        self._entry = entry
+        self._max_body_size = max_body_size
+        self._on_done = on_done
+        self._body_file = tempfile.TemporaryFile()
+        self._size = 0
+        self._data = None
+
+    def __getattr__(self, name):
+        return getattr(self._response, name)
+
+    def _copy(self, chunk):
+        self._size += len(chunk)
+        if self._body_file is not None:
+            if self._size > self._max_body_size:
+                self._body_file.close()
+                self._body_file = None
+            else:
+                self._body_file.write(chunk)
+        return chunk
+
+    def read(self, *args, **kwargs):
+        return self._copy(self._response.read(*args, **kwargs))
+
+    def stream(self, *args, **kwargs):
+        for chunk in self._response.stream(*args, **kwargs):
+            yield self._copy(chunk)
+
+    @property
+    def data(self):
+        # Callers that read the whole body at once (e.g. get_events) never release the connection
+        if self._data is None:
+            self._data = self.read()
+            self.release_conn()
+        return self._data
+
+    def release_conn(self):
+        self._response.release_conn()
+        if self._entry is None:
+            return
+        entry, self._entry = self._entry, None
+        if self._body_file is None:
+            entry["size"] = self._size
+        else:
+            self._body_file.seek(0)
+        try:
+            self._on_done(entry, self._body_file)
+        finally:
+            if self._body_file is not None:
+                self._body_file.close()
+
+
+class CassetteRecorder(_Attachable):
+    def __init__(self, path, max_body_size=consts.CASSETTE_MAX_BODY_SIZE):
+        super().__init__()
+        self.path = path
+        self.max_body_size = max_body_size
+        self._started = time.monotonic()
+        self._start_time = time.time()
+        self._digests = set()
+        self._lock = threading.Lock()
+        self._file = gzip.open(path, "wt")
+        self._file.write(json.dumps({"version": 1, "start_time": self._start_time}) + "\n")
+        atexit.register(self.close)
+
+    def close(self):
+        super().close()
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+                log.info("API cassette written to %s", self.path)
+
+    def _write(self, entry, body):
+        if body is not None:
+            digest = hashlib.sha256(body).hexdigest()
+            entry["digest"] = digest
+            if digest not in self._digests:
+                self._digests.add(digest)
+                entry["body"] = base64.b64encode(body).decode()
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(json.dumps(entry) + "\n")
+
+    def _write_stream(self, entry, body_file):
+        """Writes an entry whose body is read from `body_file`, base64 encoded chunk by chunk"""
+        if body_file is None:
+            self._write(entry, None)
+            return
+
+        digest = hashlib.sha256()
+        for chunk in iter(lambda: body_file.read(consts.DOWNLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+        entry["digest"] = digest.hexdigest()
+        body_file.seek(0)
+
+        with self._lock:
+            if self._file.closed:
+                return
+            if entry["digest"] in self._digests:
+                self._file.write(json.dumps(entry) + "\n")
+                return
+            self._digests.add(entry["digest"])
+            # Same line as _write, with the body appended as it is read. Base64 chunks are encoded
+            # from multiples of 3 bytes, so they concatenate into one valid base64 string.
+            self._file.write(json.dumps(entry)[:-1] + ', "body": "')
+            for chunk in iter(lambda: body_file.read(3 * 64 * 1024), b""):
+                self._file.write(base64.b64encode(chunk).decode())
+            self._file.write('"}\n')
+
+    def attach(self, api_client):
+        request = api_client.rest_client.request
+
+        def recording_request(method, url, query_params=None, headers=None, *args, **kwargs):
+            preload_content = kwargs.get("_preload_content", True)
+            entry = {
+                "t": round(time.monotonic() - self._started, 6),
+                "key": _get_key(method, _get_path(api_client, url), query_params, headers),
+            }
+            started = time.monotonic()
+            try:
+                response = request(method, url, query_params, headers, *args, **kwargs)
+            except ApiException as e:
+                entry.update(duration=round(time.monotonic() - started, 6), status=e.status, reason=e.reason,
+                             headers=dict(e.headers or {}))
+                self._write(entry, (e.body or "").encode() if isinstance(e.body, str) else e.body)
+                raise
+            except Exception as e:
+                entry.update(duration=round(time.monotonic() - started, 6), error=repr(e))
+                self._write(entry, None)
+                raise
+
+            entry.update(duration=round(time.monotonic() - started, 6), status=response.status,
+                         reason=response.reason, headers=dict(response.getheaders()))
+            if preload_content:
+                self._write(entry, response.data.encode("utf8"))
+                return response
+
+            size = response.getheader("content-length")
+            if size is not None and int(size) > self.max_body_size:
+                # Too large to keep, only the size is recorded and zeros are replayed
+                entry["size"] = int(size)
+                self._write(entry, None)
+                return response
+
+            # Written once the caller consumed the body and released the connection
+            return _TeeResponse(response, entry, self.max_body_size, self._write_stream)
+
+        self._wrap(api_client, recording_request)
+
+
+class CassettePlayer(_Attachable):
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._entries = {}
+        self._times = {}
+        bodies = {}
+
+        with gzip.open(path, "rt") as f:
+            header = json.loads(f.readline())
+            for line in f:
+                entry = json.loads(line)
+                if "body" in entry:
+                    bodies[entry["digest"]] = base64.b64decode(entry.pop("body"))
+                self._entries.setdefault(entry["key"], []).append(entry)
+
+        for key, entries in self._entries.items():
+            entries.sort(key=lambda e: e["t"])
+            self._times[key] = [entry["t"] for entry in entries]
+            for entry in entries:
+                if "digest" in entry:
+                    entry["body"] = bodies[entry["digest"]]
+
+        self.clock = VirtualClock(header["start_time"])
+        log.info("Loaded API cassette %s with %d distinct requests", path, len(self._entries))
+
+    def _find(self, key):
+        entries = self._entries.get(key)
+        if not entries:
+            raise CassetteMissError(f"No recorded response for {key} in {self.path}")
+        index = bisect_right(self._times[key], self.clock.now)
+        return entries[max(0, index - 1)]
+
+    def attach(self, api_client):
+        def replaying_request(method, url, query_params=None, headers=None, *args, **kwargs):
+            entry = self._find(_get_key(method, _get_path(api_client, url), query_params, headers))
+            self.clock.advance(entry["duration"])
+            if "error" in entry:
+                raise urllib3.exceptions.HTTPError(entry["error"])
+
+            body = entry.get("body", entry.get("size", b""))
+            return _make_response(entry["status"], entry["reason"], entry["headers"], body,
+                                  kwargs.get("_preload_content", True))
+
+        self._wrap(api_client, replaying_request)
+
+
+def record(api_client, path) -> CassetteRecorder:
+    """Records every request of the given swagger ApiClient to the cassette at `path`"""
+    with _cassettes_lock:
+        if path not in _cassettes:
+            _cassettes[path] = CassetteRecorder(path)
+        recorder = _cassettes[path]
+    recorder.attach(api_client)
+    return recorder
+
+
+def replay(api_client, path) -> CassettePlayer:
+    """
+    Serves every request of the given swagger ApiClient from the cassette at `path`. The client's
+    waits are expected to use the returned player's `clock`.
+    """
+    with _cassettes_lock:
+        if path not in _cassettes:
+            _cassettes[path] = CassettePlayer(path)
+        player = _cassettes[path]
+    player.attach(api_client)
+    return player
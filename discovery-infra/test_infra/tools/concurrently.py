@@ -15,14 +15,37 @@ def _safe_run(job, job_id, done_handler):
             done_handler(job_id)
 
 
-def run_concurrently(jobs, done_handler=None, max_workers=5, timeout=2 ** 31):
+class ConcurrentJobsError(Exception):
+    """
+    Raised by run_concurrently with collect_errors when several jobs failed, holding the exception of
+    every failed job by job id. A single failure is raised as is.
+    """
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("; ".join(f"{job_id}: {error!r}" for job_id, error in errors.items()))
+
+
+def run_concurrently(jobs, done_handler=None, max_workers=5, timeout=2 ** 31, collect_errors=False):
     result = {}
+    errors = {}
     if isinstance(jobs, (list, tuple)):
         jobs = dict(enumerate(jobs))
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
         futures = [(job_id, executor.submit(_safe_run, *(job, job_id, done_handler)))
                    for job_id, job in jobs.items()]
         for job_id, future in futures:
-            result[job_id] = future.result(timeout=timeout)
+            if not collect_errors:
+                result[job_id] = future.result(timeout=timeout)
+                continue
+            try:
+                result[job_id] = future.result(timeout=timeout)
+            except Exception as e:
+                errors[job_id] = e
 
+    if len(errors) == 1:
+        # Callers keep catching the error type of the job, as when it ran on its own
+        raise next(iter(errors.values()))
+    if errors:
+        raise ConcurrentJobsError(errors)
     return result
@@ -0,0 +1,63 @@
+import os
+import ssl
+import threading
+
+import certifi
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+from test_infra import consts
+
+_lock = threading.Lock()
+_session = None
+_pool_managers = {}
+
+
+def get_pool_maxsize():
+    return int(os.environ.get("HTTP_POOL_MAXSIZE") or consts.HTTP_POOL_MAXSIZE)
+
+
+def get_session() -> requests.Session:
+    """
+    Returns the process-wide requests session. Connections are kept alive and reused per host,
+    so repeated short requests (health checks, readiness probes, SSO refreshes) skip the TCP
+    and TLS setup
+    """
+    global _session
+
+    with _lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=consts.HTTP_POOL_CONNECTIONS, pool_maxsize=get_pool_maxsize())
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+
+def get_pool_manager(verify_ssl=True, ssl_ca_cert=None) -> urllib3.PoolManager:
+    """Returns the process-wide urllib3 pool manager matching the given TLS settings"""
+    key = (verify_ssl, ssl_ca_cert)
+
+    with _lock:
+        if key not in _pool_managers:
+            _pool_managers[key] = urllib3.PoolManager(
+                num_pools=consts.HTTP_POOL_CONNECTIONS,
+                maxsize=get_pool_maxsize(),
+                cert_reqs=ssl.CERT_REQUIRED if verify_ssl else ssl.CERT_NONE,
+                ca_certs=ssl_ca_cert or certifi.where(),
+            )
+        return _pool_managers[key]
+
+
+def share_api_client_pool(api_client):
+    """Replaces the private pool of a swagger ApiClient with the process-wide one"""
+    configuration = api_client.configuration
+    if configuration.proxy or configuration.cert_file or configuration.assert_hostname is not None:
+        return
+
+    api_client.rest_client.pool_manager = get_pool_manager(
+        verify_ssl=configuration.verify_ssl,
+        ssl_ca_cert=configuration.ssl_ca_cert
+    )
@@ -0,0 +1,258 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager, suppress
+from concurrent.futures import FIRST_EXCEPTION, ThreadPoolExecutor, wait
+
+from logger import log
+from test_infra import consts
+
+MIB = 1024 ** 2
+
+DownloadResult = namedtuple("DownloadResult", ["file_path", "size", "sha256", "seconds", "bytes_per_second"])
+
+
+@contextmanager
+def atomic_write(file_path):
+    """
+    Opens a temporary file next to `file_path` for writing, that is renamed into place only if the
+    block completes, so readers never observe a partial file. It is removed if the block fails.
+    """
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(file_path)}.", suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            yield f
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        with suppress(FileNotFoundError):
+            os.unlink(tmp_path)
+        raise
+
+
+def stream_to_file(response, file_path, chunk_size=consts.DOWNLOAD_CHUNK_SIZE, on_chunk=None):
+    """
+    Writes an unread urllib3 response to `file_path` chunk by chunk, so memory use does not depend
+    on the body size, see `atomic_write`.
+    :return: Number of bytes written
+    """
+    written = 0
+    try:
+        with atomic_write(file_path) as f:
+            for chunk in response.stream(chunk_size, decode_content=True):
+                if on_chunk:
+                    on_chunk(chunk)
+                f.write(chunk)
+                written += len(chunk)
+    finally:
+        response.release_conn()
+
+    log.debug("Wrote %d bytes to %s", written, file_path)
+    return written
+
+
+class _RangeNotHonored(RuntimeError):
+    """Raised when a segment request is answered with something other than the requested byte range"""
+
+
+class _Segment:
+    def __init__(self, start, end):
+        self.start = start
+        self.end = end  # inclusive, as in HTTP Range
+        self.written = 0
+
+    @property
+    def size(self):
+        return self.end - self.start + 1
+
+    @property
+    def is_done(self):
+        return self.written >= self.size
+
+
+class RangedDownload:
+    """
+    Downloads a file in concurrent HTTP Range segments into a preallocated file, hashing it with
+    sha256 while the segments arrive.
+    Progress is kept on the object, so calling `run` again after a failure only fetches the missing
+    byte ranges. Servers that ignore Range requests, either on the probe or on any of the segment
+    requests, are downloaded as a single stream.
+
+    :param fetch: callable receiving an optional inclusive (start, end) byte range and returning
+                  an unread urllib3 response
+    """
+
+    def __init__(self, fetch, file_path, segments=consts.DOWNLOAD_SEGMENTS,
+                 chunk_size=consts.DOWNLOAD_CHUNK_SIZE, min_segment_size=consts.DOWNLOAD_MIN_SEGMENT_SIZE):
+        self._fetch = fetch
+        self.file_path = file_path
+        self._segments_count = segments
+        self._chunk_size = chunk_size
+        self._min_segment_size = min_segment_size
+        self._size = None
+        self._segments = None
+        self._fetched = 0
+        self._lock = threading.Lock()
+
+    def run(self) -> DownloadResult:
+        started = time.monotonic()
+        self._fetched = 0
+
+        if self._segments is None:
+            response = self._fetch((0, 0))
+            self._size = self._get_ranged_size(response)
+            if self._size is None:
+                return self._finish(started, *self._stream_whole(response))
+
+            # Read the probed byte so the connection is clean when it goes back to the pool
+            response.read()
+            response.release_conn()
+            self._segments = self._split(self._size)
+            self._preallocate()
+        else:
+            log.info("Resuming download of %s, %d/%d bytes already written",
+                     self.file_path, self._written, self._size)
+
+        try:
+            digest = self._download_segments()
+        except _RangeNotHonored as e:
+            log.warning("%s, falling back to a single stream", e)
+            # Whatever the segments wrote is not trusted anymore, the stream replaces the whole file
+            self._segments = None
+            self._size = None
+            return self._finish(started, *self._stream_whole(self._fetch(None)))
+
+        return self._finish(started, self._size, digest)
+
+    @property
+    def _written(self):
+        return sum(segment.written for segment in self._segments)
+
+    @staticmethod
+    def _get_ranged_size(response):
+        content_range = response.getheader("content-range") or ""
+        match = re.match(r"bytes \d+-\d+/(\d+)", content_range)
+        if response.status != 206 or not match:
+            return None
+        return int(match.group(1))
+
+    def _split(self, size):
+        count = max(1, min(self._segments_count, size // self._min_segment_size))
+        step = size // count
+        bounds = [i * step for i in range(count)] + [size]
+        return [_Segment(bounds[i], bounds[i + 1] - 1) for i in range(count)]
+
+    def _preallocate(self):
+        with open(self.file_path, "wb") as f:
+            if hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(f.fileno(), 0, self._size)
+            else:
+                f.truncate(self._size)
+
+    def _stream_whole(self, response):
+        log.info("Server does not support ranged requests, downloading %s as a single stream", self.file_path)
+        sha256 = hashlib.sha256()
+        size = stream_to_file(response, self.file_path, self._chunk_size, on_chunk=sha256.update)
+        self._fetched += size
+
+        content_length = int(response.getheader("content-length") or size)
+        if size < content_length:
+            raise RuntimeError(f'Could not complete download {self.file_path}. '
+                               f'Actual size: {size}. Expected size: {content_length}')
+        return size, sha256.hexdigest()
+
+    def _check_segment_response(self, response, offset):
+        content_range = response.getheader("content-range") or ""
+        match = re.match(r"bytes (\d+)-\d+/\d+", content_range)
+        if response.status != 206 or not match or int(match.group(1)) != offset:
+            # The body is not read, so the connection must not be reused
+            response.close()
+            raise _RangeNotHonored(f"Request for {self.file_path} from byte {offset} was answered with status "
+                                   f"{response.status} and Content-Range '{content_range}'")
+
+    def _download_segment(self, segment):
+        offset = segment.start + segment.written
+        response = self._fetch((offset, segment.end))
+        try:
+            # Nothing may be written at the segment offset unless it is the body of that exact range
+            self._check_segment_response(response, offset)
+            with open(self.file_path, "r+b") as f:
+                f.seek(offset)
+                for chunk in response.stream(self._chunk_size):
+                    chunk = chunk[:segment.size - segment.written]
+                    f.write(chunk)
+                    # Written bytes must be on disk before the hasher may read them
+                    f.flush()
+                    with self._lock:
+                        segment.written += len(chunk)
+                        self._fetched += len(chunk)
+                    if segment.is_done:
+                        break
+        finally:
+            response.release_conn()
+
+        if not segment.is_done:
+            raise RuntimeError(f"Segment {segment.start}-{segment.end} of {self.file_path} ended early, "
+                               f"got {segment.written}/{segment.size} bytes")
+
+    def _contiguous_end(self):
+        with self._lock:
+            end = 0
+            for segment in self._segments:
+                end = segment.start + segment.written
+                if not segment.is_done:
+                    break
+            return end
+
+    def _download_segments(self):
+        sha256 = hashlib.sha256()
+        hashed = 0
+        pending = [segment for segment in self._segments if not segment.is_done]
+
+        with open(self.file_path, "rb") as reader, ThreadPoolExecutor(max_workers=len(self._segments)) as executor:
+            futures = [executor.submit(self._download_segment, segment) for segment in pending]
+            not_done = futures
+            while not_done:
+                _, not_done = wait(not_done, timeout=0.5, return_when=FIRST_EXCEPTION)
+                hashed = self._hash_until(reader, sha256, hashed, self._contiguous_end())
+                if any(future.done() and future.exception() for future in futures):
+                    break
+
+        errors = [future.exception() for future in futures if future.done() and future.exception()]
+        for error in errors:
+            if isinstance(error, _RangeNotHonored):
+                raise error
+        if errors:
+            raise RuntimeError(f"Could not complete download {self.file_path}, "
+                               f"{self._written}/{self._size} bytes written: {errors[0]}") from errors[0]
+
+        with open(self.file_path, "rb") as reader:
+            self._hash_until(reader, sha256, hashed, self._size)
+        return sha256.hexdigest()
+
+    def _hash_until(self, reader, sha256, offset, end):
+        reader.seek(offset)
+        while offset < end:
+            data = reader.read(min(self._chunk_size, end - offset))
+            if not data:
+                break
+            sha256.update(data)
+            offset += len(data)
+        return offset
+
+    def _finish(self, started, size, digest):
+        seconds = max(time.monotonic() - started, 1e-6)
+        actual_size = os.path.getsize(self.file_path)
+        if actual_size != size:
+            raise RuntimeError(f'Could not complete download {self.file_path}. '
+                               f'Actual size: {actual_size}. Expected size: {size}')
+
+        result = DownloadResult(self.file_path, size, digest, seconds, self._fetched / seconds)
+        log.info("Downloaded %s: fetched %.1f/%.1f MiB in %.1fs (%.1f MiB/s), sha256 %s",
+                 self.file_path, self._fetched / MIB, size / MIB, seconds, result.bytes_per_second / MIB, digest)
+        return result
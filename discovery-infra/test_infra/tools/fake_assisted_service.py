@@ -0,0 +1,683 @@
+"""
+Local stand-in for the subset of the assisted-service REST API (/api/assisted-install/v1) used by
+InventoryClient, for measuring polling, download and log-harvest code paths without a live service.
+
+Hosts and clusters move through scripted statuses driven by a (scalable) clock, so responses change
+over time the way a real installation does. Response latency, inventory payload size and the sizes
+of the ISO and log bundles are configurable.
+
+    python -m test_infra.tools.fake_assisted_service --port 8090 --clusters 2 --hosts 5 --latency 0.05
+
+and point the client at http://127.0.0.1:8090. A scenario file can override the default scripts:
+
+    {
+        "host": [{"status": "discovering", "duration": 10}, {"status": "known"}],
+        "hosts": {"2": [{"status": "discovering", "duration": 10}, {"status": "insufficient"}]},
+        "host_install": [{"status": "installing-in-progress", "duration": 60,
+                          "stages": ["Starting installation", "Rebooting", "Done"]},
+                         {"status": "installed"}]
+    }
+"""
+import gzip
+import io
+import json
+import random
+import re
+import tarfile
+import threading
+import time
+import uuid
+from argparse import ArgumentParser
+from collections import Counter, namedtuple
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from logger import log
+from test_infra import consts
+
+API_PREFIX = "/api/assisted-install/v1"
+MIB = 1024 ** 2
+
+Step = namedtuple("Step", ["status", "duration", "status_info", "stages"])
+
+
+def make_script(steps):
+    """Builds a script from a list of {"status", "duration", "status_info", "stages"} dicts"""
+    return [Step(step["status"], step.get("duration"), step.get("status_info", step["status"]),
+                 tuple(step.get("stages", ()))) for step in steps]
+
+
+DEFAULT_HOST_SCRIPT = make_script([
+    {"status": consts.NodesStatus.DISCOVERING, "duration": 5, "status_info": "Waiting for host to send hardware details"},
+    {"status": consts.NodesStatus.KNOWN, "status_info": "Host is ready to be installed"},
+])
+
+DEFAULT_HOST_INSTALL_SCRIPT = make_script([
+    {"status": consts.NodesStatus.PREPARING_FOR_INSTALLATION, "duration": 5},
+    {"status": consts.NodesStatus.INSTALLING, "duration": 5},
+    {"status": consts.NodesStatus.INSTALLING_IN_PROGRESS, "duration": 60, "stages": consts.all_host_stages},
+    {"status": consts.NodesStatus.INSTALLED, "status_info": "Done"},
+])
+
+DEFAULT_CLUSTER_FINALIZING_DURATION = 10
+
+
+def _isoformat(timestamp):
+    # isoformat() drops the fraction on whole seconds, the service (and the client parsing) always has it
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class ScriptedStatus:
+    """
+    Status that walks through a script of steps. Steps without a duration are final; a new script
+    can be started at any time, e.g. when the installation is triggered.
+    """
+
+    def __init__(self, script, started_at):
+        self.script = script
+        self.started_at = started_at
+
+    def restart(self, script, started_at):
+        self.script = script
+        self.started_at = started_at
+
+    def transitions(self, now):
+        """Yields (started_at, step) for every step reached by `now`"""
+        step_started_at = self.started_at
+        for step in self.script:
+            if step_started_at > now:
+                return
+            yield step_started_at, step
+            if step.duration is None:
+                return
+            step_started_at += step.duration
+
+    def current(self, now):
+        reached = list(self.transitions(now))
+        return reached[-1] if reached else (self.started_at, self.script[0])
+
+    @property
+    def total_duration(self):
+        return sum(step.duration or 0 for step in self.script)
+
+
+class FakeHost:
+    def __init__(self, service, cluster, index, script, registers_at):
+        self.service = service
+        self.cluster = cluster
+        self.id = str(uuid.uuid4())
+        self.index = index
+        self.hostname = f"fake-host-{cluster.index}-{index}"
+        self.role = consts.NodeRoles.MASTER if index < consts.NUMBER_OF_MASTERS else consts.NodeRoles.WORKER
+        self.registers_at = registers_at
+        self.status = ScriptedStatus(script, registers_at)
+        self.inventory = json.dumps(self._make_inventory(service.inventory_size))
+        self._reported = None
+        self._reported_stages = 0
+
+    def _make_inventory(self, size):
+        inventory = {
+            "hostname": self.hostname,
+            "interfaces": [{
+                "name": "eth0",
+                "product": "0x0001",
+                "mac_address": "52:54:00:%02x:%02x:%02x" % (self.cluster.index % 256, self.index // 256, self.index % 256),
+                "ipv4_addresses": [f"192.168.{self.cluster.index % 256}.{10 + self.index % 240}/24"],
+                "ipv6_addresses": [],
+                "speed_mbps": 1000,
+            }],
+            "disks": [{"name": "vda", "path": "/dev/vda", "drive_type": "HDD", "size_bytes": 128 * 1024 ** 3}],
+            "cpu": {"count": 4},
+            "memory": {"physical_bytes": 16 * 1024 ** 3},
+        }
+        padding = size - len(json.dumps(inventory))
+        if padding > 0:
+            inventory["padding"] = "x" * padding
+        return inventory
+
+    def is_registered(self, now):
+        return now >= self.registers_at
+
+    def sync(self, now):
+        """Emits the events of every transition since the previous sync"""
+        for started_at, step in self.status.transitions(now):
+            if self._reported is None or started_at > self._reported[0]:
+                if self._reported is None:
+                    self.service.add_event(self.cluster, f"Host {self.hostname}: registered to cluster", started_at, self)
+                else:
+                    self.service.add_event(self.cluster, f"Host {self.hostname}: updated status from "
+                                                         f"\"{self._reported[1].status}\" to \"{step.status}\" "
+                                                         f"({step.status_info})", started_at, self)
+                self._reported = (started_at, step)
+
+        stages = self._get_stages(now)
+        for stage, stage_started_at in stages[self._reported_stages:]:
+            self.service.add_event(self.cluster, f"Host {self.hostname}: reached installation stage {stage}",
+                                   stage_started_at, self)
+        self._reported_stages = len(stages)
+
+    def install(self, now):
+        self.status.restart(self.service.get_host_install_script(self.index), now)
+        self._reported_stages = 0
+
+    def _get_stages(self, now):
+        """Returns (stage, started_at) of the progress stages the current script has reached"""
+        stages = []
+        for started_at, step in self.status.transitions(now):
+            stage_duration = (step.duration or 0) / len(step.stages) if step.stages else 0
+            for i, stage in enumerate(step.stages):
+                stage_started_at = started_at + i * stage_duration
+                if stage_started_at > now:
+                    break
+                stages.append((stage, stage_started_at))
+        return stages
+
+    def to_dict(self, now):
+        started_at, step = self.status.current(now)
+        stages = self._get_stages(now)
+        stage, stage_started_at = stages[-1] if stages else ("", None)
+        updated_at = max(started_at, stage_started_at or 0)
+        hardware_status = "pending" if step.status == consts.NodesStatus.DISCOVERING else "success"
+        return {
+            "kind": "Host",
+            "id": self.id,
+            "href": f"{API_PREFIX}/clusters/{self.cluster.id}/hosts/{self.id}",
+            "cluster_id": self.cluster.id,
+            "status": step.status,
+            "status_info": step.status_info,
+            "status_updated_at": _isoformat(self.service.wall_time(started_at)),
+            "created_at": _isoformat(self.service.wall_time(self.registers_at)),
+            "updated_at": _isoformat(self.service.wall_time(updated_at)),
+            "requested_hostname": self.hostname,
+            "role": self.role,
+            "bootstrap": self.index == 0,
+            "inventory": self.inventory,
+            "progress": {
+                "current_stage": stage,
+                "progress_info": "",
+                "stage_started_at": _isoformat(self.service.wall_time(stage_started_at)) if stage else None,
+            },
+            "validations_info": json.dumps({"hardware": [
+                {"id": "has-min-cpu-cores", "status": hardware_status, "message": "Sufficient CPU cores"},
+                {"id": "has-min-memory", "status": hardware_status, "message": "Sufficient minimum RAM"},
+            ]}),
+        }
+
+
+class FakeCluster:
+    def __init__(self, service, index, name, hosts_count, now):
+        self.service = service
+        self.index = index
+        self.id = str(uuid.uuid4())
+        self.name = name
+        self.created_at = now
+        self.install_started_at = None
+        self.image_generated_at = None
+        self.hosts = [FakeHost(service, self, i, service.get_host_script(i), now + i * service.register_interval)
+                      for i in range(hosts_count)]
+        self.events = []
+        self.status = None
+        self._reported = None
+
+    def install(self, now):
+        self.install_started_at = now
+        for host in self.hosts:
+            host.install(now)
+        installing = max(host.status.total_duration for host in self.hosts) if self.hosts else 0
+        self.status = ScriptedStatus(make_script([
+            {"status": consts.ClusterStatus.PREPARING_FOR_INSTALLATION, "duration": 5},
+            {"status": consts.ClusterStatus.INSTALLING, "duration": max(0, installing - 5)},
+            {"status": consts.ClusterStatus.FINALIZING, "duration": DEFAULT_CLUSTER_FINALIZING_DURATION},
+            {"status": consts.ClusterStatus.INSTALLED, "status_info": "Cluster is installed"},
+        ]), now)
+
+    def _get_status(self, now):
+        if self.status is not None:
+            started_at, step = self.status.current(now)
+            return step.status, step.status_info, started_at
+
+        registered = [host for host in self.hosts if host.is_registered(now)]
+        if len(registered) == len(self.hosts) and \
+                all(host.status.current(now)[1].status == consts.NodesStatus.KNOWN for host in registered):
+            ready_at = max(host.status.current(now)[0] for host in registered) if registered else self.created_at
+            return consts.ClusterStatus.READY, "Cluster ready to be installed", ready_at
+        return consts.ClusterStatus.INSUFFICIENT, "Cluster is not ready for install", self.created_at
+
+    def sync(self, now):
+        for host in self.hosts:
+            if host.is_registered(now):
+                host.sync(now)
+
+        status, _, started_at = self._get_status(now)
+        if self._reported is None:
+            self.service.add_event(self, f"Registered cluster \"{self.name}\"", self.created_at)
+        if status != self._reported:
+            self.service.add_event(self, f"Updated status of cluster {self.name} to {status}", started_at)
+            self._reported = status
+
+    def get_hosts(self, now):
+        return [host.to_dict(now) for host in self.hosts if host.is_registered(now)]
+
+    def to_dict(self, now):
+        status, status_info, started_at = self._get_status(now)
+        return {
+            "kind": "Cluster",
+            "id": self.id,
+            "href": f"{API_PREFIX}/clusters/{self.id}",
+            "name": self.name,
+            "openshift_version": consts.DEFAULT_OPENSHIFT_VERSION,
+            "base_dns_domain": "redhat.com",
+            "status": status,
+            "status_info": status_info,
+            "status_updated_at": _isoformat(self.service.wall_time(started_at)),
+            "created_at": _isoformat(self.service.wall_time(self.created_at)),
+            "updated_at": _isoformat(self.service.wall_time(max(started_at, self.created_at))),
+            "install_started_at": _isoformat(self.service.wall_time(self.install_started_at or 0))
+            if self.install_started_at else "0001-01-01T00:00:00Z",
+            "image_info": {
+                "size_bytes": self.service.iso_size,
+                "created_at": _isoformat(self.service.wall_time(self.image_generated_at))
+                if self.image_generated_at else None,
+                "type": consts.ImageType.FULL_ISO,
+            },
+            "hosts": self.get_hosts(now),
+        }
+
+
+class FakeAssistedService:
+    """
+    In-memory assisted-service state. Status scripts run on the service clock, which advances
+    `time_scale` times faster than wall-clock time.
+    """
+
+    def __init__(self, clusters=1, hosts=5, latency=0.0, latency_jitter=0.0, inventory_size=4096,
+                 iso_size=100 * MIB, logs_size=MIB, register_interval=1.0, time_scale=1.0, scenario=None):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.inventory_size = inventory_size
+        self.iso_size = iso_size
+        self.logs_size = logs_size
+        self.register_interval = register_interval
+        self.time_scale = time_scale
+        self.hosts_per_cluster = hosts
+        self.scenario = scenario or {}
+        self.requests = Counter()
+        self.clusters = {}
+        self._lock = threading.RLock()
+        self._wall_started = time.time()
+        self._started = time.monotonic()
+        self._iso_block = random.Random(0).getrandbits(MIB * 8).to_bytes(MIB, "little")
+        self._logs_cache = {}
+
+        for i in range(clusters):
+            self.register_cluster(f"{consts.CLUSTER_PREFIX}-fake-{i}")
+
+    def now(self):
+        return (time.monotonic() - self._started) * self.time_scale
+
+    def wall_time(self, service_time):
+        return self._wall_started + service_time / self.time_scale
+
+    def get_host_script(self, index):
+        steps = self.scenario.get("hosts", {}).get(str(index)) or self.scenario.get("host")
+        return make_script(steps) if steps else DEFAULT_HOST_SCRIPT
+
+    def get_host_install_script(self, index):
+        steps = self.scenario.get("hosts_install", {}).get(str(index)) or self.scenario.get("host_install")
+        return make_script(steps) if steps else DEFAULT_HOST_INSTALL_SCRIPT
+
+    def register_cluster(self, name, hosts_count=None):
+        with self._lock:
+            hosts_count = self.hosts_per_cluster if hosts_count is None else hosts_count
+            cluster = FakeCluster(self, len(self.clusters), name, hosts_count, self.now())
+            self.clusters[cluster.id] = cluster
+            return cluster
+
+    def get_cluster(self, cluster_id):
+        with self._lock:
+            cluster = self.clusters.get(cluster_id)
+            if cluster is not None:
+                cluster.sync(self.now())
+            return cluster
+
+    def add_event(self, cluster, message, service_time, host=None):
+        cluster.events.append({
+            "cluster_id": cluster.id,
+            "host_id": host.id if host else None,
+            "severity": "info",
+            "message": message,
+            "event_time": _isoformat(self.wall_time(service_time)),
+        })
+
+    def iter_iso(self, start, end):
+        """Yields the deterministic ISO content of the inclusive byte range"""
+        offset = start
+        while offset <= end:
+            block_offset = offset % MIB
+            length = min(MIB - block_offset, end - offset + 1)
+            yield self._iso_block[block_offset:block_offset + length]
+            offset += length
+
+    def get_logs_tar(self, cluster, host=None):
+        key = (cluster.id, host.id if host else None)
+        with self._lock:
+            if key not in self._logs_cache:
+                names = [host.hostname] if host else [h.hostname for h in cluster.hosts]
+                per_file = max(1, self.logs_size // len(names)) if names else 0
+                buffer = io.BytesIO()
+                with tarfile.open(fileobj=buffer, mode="w") as tar:
+                    for name in names:
+                        data = gzip.compress(random.Random(name).getrandbits(per_file * 8).to_bytes(per_file, "little"))
+                        info = tarfile.TarInfo(f"{cluster.name}_{name}.tar.gz")
+                        info.size = len(data)
+                        info.mtime = int(self._wall_started)
+                        tar.addfile(info, io.BytesIO(data))
+                self._logs_cache[key] = buffer.getvalue()
+            return self._logs_cache[key]
+
+    def to_prometheus(self):
+        lines = ["# TYPE fake_service_requests_total counter"]
+        with self._lock:
+            for (method, route), count in sorted(self.requests.items()):
+                lines.append(f'fake_service_requests_total{{method="{method}",route="{route}"}} {count}')
+            lines.append("# TYPE fake_service_clusters gauge")
+            lines.append(f"fake_service_clusters {len(self.clusters)}")
+            lines.append("# TYPE fake_service_hosts gauge")
+            lines.append(f"fake_service_hosts {sum(len(c.hosts) for c in self.clusters.values())}")
+        return "\n".join(lines) + "\n"
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    service: FakeAssistedService = None
+
+    ROUTES = [
+        ("GET", r"/clusters", "list_clusters"),
+        ("POST", r"/clusters", "register_cluster"),
+        ("GET", r"/clusters/(?P<cluster_id>[^/]+)", "get_cluster"),
+        ("PATCH", r"/clusters/(?P<cluster_id>[^/]+)", "get_cluster"),
+        ("DELETE", r"/clusters/(?P<cluster_id>[^/]+)", "deregister_cluster"),
+        ("GET", r"/clusters/(?P<cluster_id>[^/]+)/hosts", "list_hosts"),
+        ("GET", r"/clusters/(?P<cluster_id>[^/]+)/hosts/(?P<host_id>[^/]+)", "get_host"),
+        ("GET", r"/clusters/(?P<cluster_id>[^/]+)/events", "list_events"),
+        ("POST", r"/clusters/(?P<cluster_id>[^/]+)/downloads/image", "generate_image"),
+        ("GET", r"/clusters/(?P<cluster_id>[^/]+)/downloads/image", "download_image"),
+        ("POST", r"/clusters/(?P<cluster_id>[^/]+)/actions/install", "install_cluster"),
+        ("GET", r"/clusters/(?P<cluster_id>[^/]+)/logs", "download_cluster_logs"),
+        ("GET", r"/clusters/(?P<cluster_id>[^/]+)/hosts/(?P<host_id>[^/]+)/logs", "download_host_logs"),
+        ("GET", r"/clusters/(?P<cluster_id>[^/]+)/downloads/files", "download_file"),
+        ("GET", r"/clusters/(?P<cluster_id>[^/]+)/downloads/kubeconfig", "download_kubeconfig"),
+        ("GET", r"/clusters/(?P<cluster_id>[^/]+)/hosts/(?P<host_id>[^/]+)/downloads/ignition", "download_ignition"),
+        ("GET", r"/component_versions", "component_versions"),
+        ("GET", r"/openshift_versions", "openshift_versions"),
+        ("GET", r"/domains", "managed_domains"),
+    ]
+
+    def log_message(self, format, *args):
+        log.debug("fake-assisted-service: " + format, *args)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PATCH(self):
+        self._dispatch("PATCH")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def _dispatch(self, method):
+        url = urlparse(self.path)
+        self.query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        body_length = int(self.headers.get("Content-Length") or 0)
+        self.body = self.rfile.read(body_length) if body_length else b""
+
+        if self.service.latency or self.service.latency_jitter:
+            time.sleep(self.service.latency + random.uniform(0, self.service.latency_jitter))
+
+        if url.path in ("/health", "/ready"):
+            return self._send(200, b"", "text/plain")
+        if url.path == "/metrics":
+            return self._send(200, self.service.to_prometheus().encode(), "text/plain; version=0.0.4")
+
+        if url.path.startswith(API_PREFIX):
+            path = url.path[len(API_PREFIX):].rstrip("/") or "/"
+            for route_method, pattern, handler in self.ROUTES:
+                match = re.fullmatch(pattern, path)
+                if route_method == method and match:
+                    with self.service._lock:
+                        self.service.requests[(method, handler)] += 1
+                    return getattr(self, handler)(**match.groupdict())
+
+        self._send_json(404, {"code": "404", "reason": f"{method} {url.path} is not implemented"})
+
+    def _send(self, status, data, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload).encode(), "application/json")
+
+    def _get_cluster(self, cluster_id):
+        cluster = self.service.get_cluster(cluster_id)
+        if cluster is None:
+            self._send_json(404, {"code": "404", "reason": f"Cluster {cluster_id} not found"})
+        return cluster
+
+    def _get_host(self, cluster, host_id):
+        host = next((h for h in cluster.hosts if h.id == host_id and h.is_registered(self.service.now())), None)
+        if host is None:
+            self._send_json(404, {"code": "404", "reason": f"Host {host_id} not found"})
+        return host
+
+    def list_clusters(self):
+        with self.service._lock:
+            cluster_ids = list(self.service.clusters)
+        now = self.service.now()
+        self._send_json(200, [self.service.get_cluster(cluster_id).to_dict(now) for cluster_id in cluster_ids])
+
+    def register_cluster(self):
+        params = json.loads(self.body or b"{}")
+        cluster = self.service.register_cluster(params.get("name") or f"{consts.CLUSTER_PREFIX}-fake")
+        self._send_json(201, cluster.to_dict(self.service.now()))
+
+    def get_cluster(self, cluster_id):
+        cluster = self._get_cluster(cluster_id)
+        if cluster:
+            self._send_json(200 if self.command == "GET" else 201, cluster.to_dict(self.service.now()))
+
+    def deregister_cluster(self, cluster_id):
+        with self.service._lock:
+            if self.service.clusters.pop(cluster_id, None) is None:
+                return self._send_json(404, {"code": "404", "reason": f"Cluster {cluster_id} not found"})
+        self._send(204, b"", "application/json")
+
+    def list_hosts(self, cluster_id):
+        cluster = self._get_cluster(cluster_id)
+        if cluster:
+            self._send_json(200, cluster.get_hosts(self.service.now()))
+
+    def get_host(self, cluster_id, host_id):
+        cluster = self._get_cluster(cluster_id)
+        host = cluster and self._get_host(cluster, host_id)
+        if host:
+            self._send_json(200, host.to_dict(self.service.now()))
+
+    def list_events(self, cluster_id):
+        cluster = self._get_cluster(cluster_id)
+        if cluster:
+            host_id = self.query.get("host_id")
+            with self.service._lock:
+                events = [e for e in cluster.events if not host_id or e["host_id"] == host_id]
+            self._send_json(200, events)
+
+    def generate_image(self, cluster_id):
+        cluster = self._get_cluster(cluster_id)
+        if cluster:
+            now = self.service.now()
+            cluster.image_generated_at = now
+            self.service.add_event(cluster, consts.Events.GENERATED_IMAGE_FULL, now)
+            self._send_json(201, cluster.to_dict(now))
+
+    def download_image(self, cluster_id):
+        cluster = self._get_cluster(cluster_id)
+        if not cluster:
+            return
+
+        size = self.service.iso_size
+        start, end, status, headers = 0, size - 1, 200, {}
+        match = re.fullmatch(r"bytes=(\d*)-(\d*)", self.headers.get("Range") or "")
+        if match and size:
+            start = int(match.group(1)) if match.group(1) else max(0, size - int(match.group(2)))
+            end = min(int(match.group(2)), size - 1) if match.group(1) and match.group(2) else size - 1
+            if start > end:
+                return self._send(416, b"", "application/octet-stream", {"Content-Range": f"bytes */{size}"})
+            status, headers = 206, {"Content-Range": f"bytes {start}-{end}/{size}"}
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(end - start + 1 if size else 0))
+        self.send_header("Accept-Ranges", "bytes")
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if size:
+            for chunk in self.service.iter_iso(start, end):
+                self.wfile.write(chunk)
+
+    def install_cluster(self, cluster_id):
+        cluster = self._get_cluster(cluster_id)
+        if not cluster:
+            return
+        now = self.service.now()
+        if cluster.to_dict(now)["status"] != consts.ClusterStatus.READY:
+            return self._send_json(409, {"code": "409", "reason": f"Cluster {cluster_id} is not ready to be installed"})
+        with self.service._lock:
+            cluster.install(now)
+        self._send_json(202, cluster.to_dict(now))
+
+    def download_cluster_logs(self, cluster_id):
+        cluster = self._get_cluster(cluster_id)
+        if cluster:
+            self._send(200, self.service.get_logs_tar(cluster), "application/octet-stream")
+
+    def download_host_logs(self, cluster_id, host_id):
+        cluster = self._get_cluster(cluster_id)
+        host = cluster and self._get_host(cluster, host_id)
+        if host:
+            self._send(200, self.service.get_logs_tar(cluster, host), "application/octet-stream")
+
+    def download_file(self, cluster_id):
+        cluster = self._get_cluster(cluster_id)
+        if cluster:
+            file_name = self.query.get("file_name", "")
+            if file_name.startswith("kubeconfig"):
+                return self.download_kubeconfig(cluster_id)
+            self._send(200, json.dumps({"file_name": file_name, "cluster_id": cluster_id}).encode(),
+                       "application/octet-stream")
+
+    def download_kubeconfig(self, cluster_id):
+        cluster = self._get_cluster(cluster_id)
+        if cluster:
+            kubeconfig = (f"apiVersion: v1\nkind: Config\nclusters:\n- name: {cluster.name}\n  cluster:\n"
+                          f"    server: https://api.{cluster.name}.redhat.com:6443\n")
+            self._send(200, kubeconfig.encode(), "application/octet-stream")
+
+    def download_ignition(self, cluster_id, host_id):
+        cluster = self._get_cluster(cluster_id)
+        host = cluster and self._get_host(cluster, host_id)
+        if host:
+            self._send(200, json.dumps({"ignition": {"version": "3.1.0"}}).encode(), "application/octet-stream")
+
+    def component_versions(self):
+        self._send_json(200, {"versions": {"assisted-installer-service": "fake"}, "release_tag": "fake"})
+
+    def openshift_versions(self):
+        self._send_json(200, {consts.DEFAULT_OPENSHIFT_VERSION: {
+            "display_name": f"{consts.DEFAULT_OPENSHIFT_VERSION}.0", "release_image": "fake", "rhcos_image": "fake",
+            "support_level": "production"}})
+
+    def managed_domains(self):
+        self._send_json(200, [])
+
+
+class FakeAssistedServiceServer:
+    """Serves a FakeAssistedService over HTTP from a background thread"""
+
+    def __init__(self, service: FakeAssistedService, host="127.0.0.1", port=0):
+        self.service = service
+        handler = type("RequestHandler", (_RequestHandler,), {"service": service})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-assisted-service", daemon=True)
+        self._thread.start()
+        log.info("Fake assisted-service listening on %s", self.url)
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *_):
+        self.stop()
+
+
+def main():
+    parser = ArgumentParser(description="Run a local fake assisted-service")
+    parser.add_argument("--host", help="Address to listen on", type=str, default="127.0.0.1")
+    parser.add_argument("--port", help="Port to listen on", type=int, default=8090)
+    parser.add_argument("--clusters", help="Number of clusters registered at startup", type=int, default=1)
+    parser.add_argument("--hosts", help="Number of hosts per cluster", type=int, default=5)
+    parser.add_argument("--latency", help="Seconds added to every response", type=float, default=0.0)
+    parser.add_argument("--latency-jitter", help="Maximal random seconds added on top of --latency",
+                        type=float, default=0.0)
+    parser.add_argument("--inventory-size", help="Size in bytes of each host inventory", type=int, default=4096)
+    parser.add_argument("--iso-size", help="Size in bytes of the discovery ISO", type=int, default=100 * MIB)
+    parser.add_argument("--logs-size", help="Size in bytes of the logs bundles", type=int, default=MIB)
+    parser.add_argument("--register-interval", help="Seconds between host registrations", type=float, default=1.0)
+    parser.add_argument("--time-scale", help="How much faster than real time the scripts run", type=float, default=1.0)
+    parser.add_argument("--scenario", help="JSON file overriding the host status scripts", type=str, default=None)
+    args = parser.parse_args()
+
+    scenario = None
+    if args.scenario:
+        with open(args.scenario) as f:
+            scenario = json.load(f)
+
+    service = FakeAssistedService(
+        clusters=args.clusters, hosts=args.hosts, latency=args.latency, latency_jitter=args.latency_jitter,
+        inventory_size=args.inventory_size, iso_size=args.iso_size, logs_size=args.logs_size,
+        register_interval=args.register_interval, time_scale=args.time_scale, scenario=scenario
+    )
+    server = FakeAssistedServiceServer(service, args.host, args.port).start()
+    for cluster in service.clusters.values():
+        log.info("Registered fake cluster %s (%s) with %d hosts", cluster.name, cluster.id, len(cluster.hosts))
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import functools
+import threading
+from contextlib import suppress
+
+import libvirt
+
+from logger import log
+from test_infra import consts
+
+_lock = threading.Lock()
+_connections = {}
+
+
+class LibvirtConnection:
+    """
+    Process-wide libvirt connection, opened on first use. libvirt connections are thread-safe, so a
+    single one is shared by all the threads (e.g. run_concurrently workers). Calls made through it
+    reopen the connection and are retried once when libvirtd was restarted in the meantime.
+    Objects returned by a call (domains, networks) stay bound to the connection that returned them.
+    """
+
+    def __init__(self, uri):
+        self.uri = uri
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def get(self) -> libvirt.virConnect:
+        """Returns the underlying connection, opening it if it was not opened yet or is not alive anymore"""
+        with self._lock:
+            if self._connection is not None and not self._is_alive(self._connection):
+                log.info("Libvirt connection to %s was lost, reconnecting", self.uri)
+                self._close()
+            if self._connection is None:
+                self._connection = libvirt.open(self.uri)
+            return self._connection
+
+    @staticmethod
+    def _is_alive(connection):
+        try:
+            return connection.isAlive() == 1
+        except libvirt.libvirtError:
+            return False
+
+    def _close(self):
+        with suppress(libvirt.libvirtError):
+            self._connection.close()
+        self._connection = None
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None:
+                self._close()
+
+    def __getattr__(self, name):
+        attribute = getattr(self.get(), name)
+        if not callable(attribute):
+            return attribute
+
+        @functools.wraps(attribute)
+        def call(*args, **kwargs):
+            try:
+                return getattr(self.get(), name)(*args, **kwargs)
+            except libvirt.libvirtError:
+                with self._lock:
+                    connection = self._connection
+                # Closed or reset by another thread meanwhile counts as dead too
+                if connection is not None and self._is_alive(connection):
+                    raise
+                return getattr(self.get(), name)(*args, **kwargs)
+
+        return call
+
+
+def get_connection(uri=consts.LIBVIRT_URI) -> LibvirtConnection:
+    """Returns the process-wide connection to `uri`, which is only opened when first used"""
+    with _lock:
+        if uri not in _connections:
+            _connections[uri] = LibvirtConnection(uri)
+        return _connections[uri]
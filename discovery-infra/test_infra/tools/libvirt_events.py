@@ -0,0 +1,155 @@
+"""
+Wakeups for waits on libvirt resources.
+
+libvirt reports domain lifecycle events (started, stopped, defined...) through its event loop, but it
+has no event for DHCP leases, which are written by dnsmasq to the status files of each network.
+LibvirtEvents runs the libvirt event loop on a dedicated connection and watches the dnsmasq status
+files, and wakes up the waits whenever either changed, so a wait for "domain X got an IP" or
+"network Y has N leases" returns right after it happened. Each wait still re-evaluates its condition
+at its own interval, so it also works without events, e.g. when libvirtd is not reachable.
+
+The same domain events are passed to the registered domain listeners, which is how caches of domain
+XML learn that a domain changed, no matter whether it was changed by us, by the guest or by virsh.
+"""
+import os
+import threading
+import time
+import weakref
+
+import libvirt
+import waiting
+
+from logger import log
+from test_infra import consts
+
+_lock = threading.Lock()
+_events = None
+
+
+class LibvirtEvents:
+    def __init__(self, uri=consts.LIBVIRT_URI, leases_dir=consts.LIBVIRT_DNSMASQ_DIR):
+        self.uri = uri
+        self.leases_dir = leases_dir
+        self._changed = threading.Condition()
+        self._generation = 0
+        self._connection = None
+        self._listening = False
+        self._leases_signature = None
+        self._domain_listeners = []
+        self._listeners_lock = threading.Lock()
+
+    def start(self):
+        try:
+            # Has to be registered before the connection that the callbacks are registered on is opened
+            libvirt.virEventRegisterDefaultImpl()
+            self._connection = libvirt.open(self.uri)
+            self._connection.domainEventRegisterAny(None, libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
+                                                    self._on_domain_lifecycle, None)
+            # Hot-plugged devices change the live XML without any lifecycle event
+            for event_id in (libvirt.VIR_DOMAIN_EVENT_ID_DEVICE_ADDED, libvirt.VIR_DOMAIN_EVENT_ID_DEVICE_REMOVED):
+                self._connection.domainEventRegisterAny(None, event_id, self._on_domain_device, None)
+            self._listening = True
+            threading.Thread(target=self._run_event_loop, name="libvirt-events", daemon=True).start()
+        except (libvirt.libvirtError, AttributeError):
+            log.warning("Failed to listen to libvirt events on %s, falling back to polling", self.uri, exc_info=True)
+
+        threading.Thread(target=self._watch_leases, name="libvirt-leases", daemon=True).start()
+
+    def _run_event_loop(self):
+        while True:
+            try:
+                libvirt.virEventRunDefaultImpl()
+            except libvirt.libvirtError:
+                log.warning("libvirt event loop failed, falling back to polling", exc_info=True)
+                self._listening = False
+                return
+
+    @property
+    def is_listening(self) -> bool:
+        """Whether domain events are received, i.e. whether the domain listeners are called on changes"""
+        return self._listening
+
+    def add_domain_listener(self, callback):
+        """
+        Calls the bound method `callback` with the name of a domain whenever it changed. Only a weak
+        reference is kept, so the listener goes away together with the object it is bound to.
+        """
+        with self._listeners_lock:
+            self._domain_listeners.append(weakref.WeakMethod(callback))
+
+    def _notify_domain_listeners(self, domain):
+        name = domain.name()
+        with self._listeners_lock:
+            self._domain_listeners = [ref for ref in self._domain_listeners if ref() is not None]
+            listeners = [ref() for ref in self._domain_listeners]
+
+        for listener in listeners:
+            if listener is not None:
+                listener(name)
+
+    def _on_domain_lifecycle(self, connection, domain, event, detail, opaque):
+        self._notify_domain_listeners(domain)
+        self.notify()
+
+    def _on_domain_device(self, connection, domain, device_alias, opaque):
+        self._notify_domain_listeners(domain)
+        self.notify()
+
+    def _get_leases_signature(self):
+        try:
+            with os.scandir(self.leases_dir) as entries:
+                return tuple(sorted((entry.name, entry.stat().st_mtime, entry.stat().st_size)
+                                    for entry in entries if entry.name.endswith(".status")))
+        except OSError:
+            return None
+
+    def _watch_leases(self):
+        while True:
+            signature = self._get_leases_signature()
+            if signature != self._leases_signature:
+                self._leases_signature = signature
+                self.notify()
+            time.sleep(consts.LIBVIRT_LEASES_CHECK_INTERVAL)
+
+    def notify(self):
+        with self._changed:
+            self._generation += 1
+            self._changed.notify_all()
+
+    def wait(self, predicate, timeout_seconds, sleep_seconds, waiting_for, expected_exceptions=()):
+        """
+        Like waiting.wait, but `predicate` is also evaluated right after every libvirt change, and not
+        only every `sleep_seconds`
+        """
+        deadline = time.monotonic() + timeout_seconds
+        while True:
+            with self._changed:
+                generation = self._generation
+
+            try:
+                result = predicate()
+                if result:
+                    return result
+            except expected_exceptions:
+                pass
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise waiting.exceptions.TimeoutExpired(timeout_seconds, waiting_for)
+            with self._changed:
+                # Changes made since the predicate was evaluated wake it up right away
+                self._changed.wait_for(lambda: self._generation != generation, timeout=min(sleep_seconds, remaining))
+
+
+def get_events() -> LibvirtEvents:
+    """Returns the process-wide LibvirtEvents, started on first use"""
+    global _events
+    with _lock:
+        if _events is None:
+            _events = LibvirtEvents()
+            _events.start()
+        return _events
+
+
+def wait(predicate, timeout_seconds, sleep_seconds, waiting_for, expected_exceptions=()):
+    return get_events().wait(predicate, timeout_seconds, sleep_seconds, waiting_for, expected_exceptions)
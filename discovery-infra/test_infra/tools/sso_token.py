@@ -0,0 +1,137 @@
+import base64
+import json
+import os
+import threading
+import time
+
+from logger import log
+from test_infra import consts, utils
+from test_infra.tools import connection_pool
+
+
+class SsoTokenManager:
+    """
+    Exchanges an offline token for access tokens at the SSO service.
+    The access token and its decoded expiry are kept in memory and a daemon thread renews the token
+    before it enters the refresh window, so API requests don't wait for SSO.
+    When `cache_path` is given, processes on the same host share one token through that file,
+    guarded by a file lock.
+    """
+
+    RENEW_AHEAD = 60
+    MIN_REFRESH_INTERVAL = 10
+
+    _managers = {}
+    _managers_lock = threading.Lock()
+
+    def __init__(self, offline_token, sso_url, cache_path=None, refresh_window=consts.SSO_TOKEN_REFRESH_WINDOW):
+        self._offline_token = offline_token
+        self._sso_url = sso_url
+        self._cache_path = cache_path
+        self._refresh_window = refresh_window
+        # (token, expires_on) is replaced as a whole so readers never see a torn pair
+        self._current = (None, None)
+        self._lock = threading.Lock()
+        self._refresher = None
+
+    @classmethod
+    def get(cls, offline_token, sso_url, cache_path=None):
+        """Returns the manager shared by all clients of this process that use the given offline token"""
+        key = (offline_token, sso_url, cache_path)
+        with cls._managers_lock:
+            if key not in cls._managers:
+                cls._managers[key] = cls(offline_token, sso_url, cache_path)
+            return cls._managers[key]
+
+    @staticmethod
+    def decode_expiry(token):
+        segment = token.split('.')[1]
+        segment += '=' * (-len(segment) % 4)
+        return json.loads(base64.urlsafe_b64decode(segment))['exp']
+
+    def _is_fresh(self, token, expires_on, margin=None):
+        margin = self._refresh_window if margin is None else margin
+        # Tokens that don't expire have exp set to 0
+        return token is not None and (expires_on == 0 or expires_on - time.time() > margin)
+
+    def get_cached_token(self):
+        """Returns the in-memory token if it is still valid, without ever contacting SSO"""
+        token, expires_on = self._current
+        return token if self._is_fresh(token, expires_on) else None
+
+    def get_token(self):
+        token, expires_on = self._current
+        if self._is_fresh(token, expires_on):
+            return token
+
+        with self._lock:
+            token, expires_on = self._current
+            if not self._is_fresh(token, expires_on):
+                token, expires_on = self._refresh()
+            self._start_refresher()
+        return token
+
+    def _refresh(self, margin=None):
+        if self._cache_path:
+            with utils.file_lock_context(f"{self._cache_path}.lock"):
+                token, expires_on = self._read_cache()
+                if not self._is_fresh(token, expires_on, margin):
+                    token, expires_on = self._fetch()
+                    self._write_cache(token, expires_on)
+        else:
+            token, expires_on = self._fetch()
+
+        self._current = (token, expires_on)
+        return token, expires_on
+
+    def _fetch(self):
+        params = {
+            "client_id": "cloud-services",
+            "grant_type": "refresh_token",
+            "refresh_token": self._offline_token,
+        }
+
+        log.info("Refreshing API key")
+        response = connection_pool.get_session().post(self._sso_url, data=params)
+        response.raise_for_status()
+
+        token = response.json()['access_token']
+        return token, self.decode_expiry(token)
+
+    def _read_cache(self):
+        try:
+            with open(self._cache_path) as f:
+                cached = json.load(f)
+            return cached["access_token"], cached["expires_on"]
+        except (OSError, ValueError, KeyError):
+            return None, None
+
+    def _write_cache(self, token, expires_on):
+        fd = os.open(f"{self._cache_path}.tmp", os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"access_token": token, "expires_on": expires_on}, f)
+        os.replace(f"{self._cache_path}.tmp", self._cache_path)
+
+    def _start_refresher(self):
+        if self._refresher is not None and self._refresher.is_alive():
+            return
+        self._refresher = threading.Thread(target=self._refresh_loop, name="sso-token-refresher", daemon=True)
+        self._refresher.start()
+
+    def _refresh_loop(self):
+        while True:
+            _, expires_on = self._current
+            if expires_on == 0:
+                return
+
+            # Renew a bit before the token enters the refresh window
+            margin = self._refresh_window + self.RENEW_AHEAD
+            time.sleep(max(self.MIN_REFRESH_INTERVAL, expires_on - margin - time.time()))
+            try:
+                with self._lock:
+                    token, expires_on = self._current
+                    if not self._is_fresh(token, expires_on, margin):
+                        self._refresh(margin)
+            except Exception:
+                log.exception("Failed to refresh API key in the background, retrying in 30 seconds")
+                time.sleep(30)
@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+import filelock
+
+from logger import log
+from test_infra import consts
+
+FINAL_STATES = {
+    "cluster": {consts.ClusterStatus.INSTALLED, consts.ClusterStatus.ERROR, consts.ClusterStatus.CANCELLED},
+    "host": {consts.NodesStatus.INSTALLED, consts.NodesStatus.ERROR, consts.NodesStatus.DAY2_INSTALLED},
+    "stage": {consts.HostsProgressStages.DONE},
+}
+
+
+def _percentile(values, percent):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * percent / 100))]
+
+
+_stores = {}
+_store_lock = threading.Lock()
+
+
+def get_stats_store(service_url=None) -> "TransitionStatsStore":
+    """
+    Returns the process-wide store of the given assisted-service. Each service gets its own file next
+    to TRANSITION_STATS_PATH, so that e.g. runs against a local fake service don't skew the polling
+    of runs against a real one.
+    """
+    path = os.environ.get("TRANSITION_STATS_PATH") or consts.TRANSITION_STATS_PATH
+    if service_url:
+        base, extension = os.path.splitext(path)
+        path = f"{base}_{hashlib.sha1(service_url.encode()).hexdigest()[:12]}{extension}"
+
+    with _store_lock:
+        if path not in _stores:
+            _stores[path] = TransitionStatsStore(path)
+        return _stores[path]
+
+
+class TransitionStatsStore:
+    """
+    Durations of past cluster, host and installation stage transitions, keyed like
+    `host:known->preparing-for-installation`. Samples are kept in a JSON file shared by all runs on
+    the machine, so later runs can predict when the next transition is due.
+    """
+
+    def __init__(self, path=consts.TRANSITION_STATS_PATH, max_samples=consts.TRANSITION_STATS_MAX_SAMPLES):
+        self.path = path
+        self.max_samples = max_samples
+        self._samples = self._read()
+        self._lock = threading.Lock()
+
+    def _read(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def add(self, kind, from_state, to_state, seconds):
+        key = f"{kind}:{from_state}->{to_state}"
+        with self._lock:
+            self._samples.setdefault(key, []).append(round(seconds, 3))
+            self._samples[key] = self._samples[key][-self.max_samples:]
+
+        try:
+            # Merge with samples other processes wrote since the store was loaded
+            with filelock.FileLock(f"{self.path}.lock", timeout=30):
+                samples = self._read()
+                samples.setdefault(key, []).append(round(seconds, 3))
+                samples[key] = samples[key][-self.max_samples:]
+                with open(f"{self.path}.tmp", "w") as f:
+                    json.dump(samples, f)
+                os.replace(f"{self.path}.tmp", self.path)
+        except (OSError, filelock.Timeout):
+            log.warning("Failed to save transition %s to %s", key, self.path)
+
+    def get_durations(self, kind, from_state):
+        """Returns the recorded times spent in `from_state` before moving to any other state"""
+        prefix = f"{kind}:{from_state}->"
+        with self._lock:
+            return [d for key, durations in self._samples.items() if key.startswith(prefix) for d in durations]
+
+
+class TransitionTracker:
+    """
+    Follows the states of a cluster, its hosts and their installation stages across snapshots,
+    recording how long each observed state lasted and predicting when the next transition is due.
+    """
+
+    def __init__(self, store: TransitionStatsStore, record=True):
+        """
+        :param record: Whether to add the observed transitions to the store, or only use it for predictions
+        """
+        self.store = store
+        self.record = record
+        self._lock = threading.Lock()
+        # (kind, id) -> (state, entered_at, whether the entry into the state was observed)
+        self._states = {}
+
+    def observe(self, snapshot):
+        now = time.monotonic()
+        current = {("cluster", snapshot.cluster.id): snapshot.status}
+        for host in snapshot.hosts:
+            current[("host", host["id"])] = host["status"]
+            current[("stage", host["id"])] = (host.get("progress") or {}).get("current_stage") or ""
+
+        transitions = []
+        with self._lock:
+            for entity, state in current.items():
+                previous = self._states.get(entity)
+                if previous is None:
+                    self._states[entity] = (state, now, False)
+                elif previous[0] != state:
+                    if previous[2] and previous[0]:
+                        transitions.append((entity[0], previous[0], state, now - previous[1]))
+                    self._states[entity] = (state, now, True)
+            # Forget deregistered hosts
+            for entity in set(self._states) - set(current):
+                del self._states[entity]
+
+        if self.record:
+            for transition in transitions:
+                self.store.add(*transition)
+
+    def get_poll_interval(self, default, min_interval=consts.ADAPTIVE_POLL_MIN_INTERVAL,
+                          max_interval=consts.ADAPTIVE_POLL_MAX_INTERVAL):
+        """
+        Returns how long to wait before the next poll: close to the earliest transition expected from
+        the recorded durations, but never longer than `default` for states without enough history.
+        """
+        now = time.monotonic()
+        intervals = []
+        with self._lock:
+            states = list(self._states.items())
+
+        for (kind, _), (state, entered_at, observed) in states:
+            if state in FINAL_STATES[kind]:
+                continue
+
+            durations = self.store.get_durations(kind, state) if observed else []
+            remaining = [d - (now - entered_at) for d in durations if d > now - entered_at]
+            if len(remaining) < consts.ADAPTIVE_POLL_MIN_SAMPLES:
+                intervals.append(default)
+            else:
+                # Sleep until the earliest likely transition, then poll densely around it
+                intervals.append(min(max(_percentile(remaining, 10), min_interval), max_interval))
+
+        return min(intervals) if intervals else default
@@ -17,19 +17,22 @@ from functools import wraps
 from contextlib import contextmanager
 import xml.dom.minidom as md
 
-import libvirt
 import waiting
 import requests
 import filelock
 from test_infra import consts
+from test_infra.cluster_watcher import ClusterStateWatcher, index_validations
+from test_infra.host_inventory import get_host_view
+from test_infra.tools import connection_pool, libvirt_connection, libvirt_events
 import oc_utils
-from logger import log
+from logger import StateChangeLogger, log
 from retry import retry
 from pprint import pformat
 from distutils.dir_util import copy_tree
 
 
-conn = libvirt.open("qemu:///system")
+# Polling helpers only log status changes, and a heartbeat while nothing changes
+status_log = StateChangeLogger(log, heartbeat_interval=consts.STATUS_LOG_HEARTBEAT_INTERVAL)
 
 
 def run_command(command, shell=False, raise_errors=True, env=None):
@@ -74,7 +77,7 @@ def run_command_with_output(command, env=None):
 def wait_till_nodes_are_ready(nodes_count, network_name):
     log.info("Wait till %s nodes will be ready and have ips", nodes_count)
     try:
-        waiting.wait(
+        libvirt_events.wait(
             lambda: len(get_network_leases(network_name)) >= nodes_count,
             timeout_seconds=consts.NODES_REGISTERED_TIMEOUT * nodes_count,
             sleep_seconds=10,
@@ -111,6 +114,33 @@ def get_libvirt_nodes_mac_role_ip_and_name(network_name):
         raise
 
 
+def get_clock(client):
+    """Returns the clock of the client's waits: the time module, or a virtual clock when replaying a cassette"""
+    return getattr(client, "clock", time)
+
+
+def wait(predicate, timeout_seconds, sleep_seconds, waiting_for, expected_exceptions=(), clock=time):
+    """
+    waiting.wait on the given clock, so that waits on a client that replays a cassette follow its
+    virtual clock instead of sleeping in real time
+    """
+    if clock is time:
+        return waiting.wait(predicate, timeout_seconds=timeout_seconds, sleep_seconds=sleep_seconds,
+                            waiting_for=waiting_for, expected_exceptions=expected_exceptions)
+
+    deadline = clock.monotonic() + timeout_seconds
+    while True:
+        try:
+            result = predicate()
+            if result:
+                return result
+        except expected_exceptions:
+            pass
+        if clock.monotonic() >= deadline:
+            raise waiting.exceptions.TimeoutExpired(timeout_seconds, waiting_for)
+        clock.sleep(sleep_seconds)
+
+
 def wait_for_cvo_available():
     waiting.wait(
         lambda: is_cvo_available(),
@@ -159,7 +189,8 @@ def get_cluster_hosts_macs(client, cluster_id):
 
 
 def get_cluster_hosts_with_mac(client, cluster_id, macs):
-    return [client.get_host_by_mac(cluster_id, mac) for mac in macs]
+    snapshot = client.get_hosts_snapshot(cluster_id)
+    return [snapshot.get_host_by_mac(mac) for mac in macs]
 
 
 def to_utc(timestr):
@@ -197,6 +228,10 @@ def set_tf_main(tf_folder, main_str):
         main_str = _file.write(main_str)
 
 
+def expects_failure(statuses):
+    return any(status in consts.failure_statuses for status in statuses)
+
+
 def are_hosts_in_status(
         hosts, nodes_count, statuses, fall_on_error_status=True
 ):
@@ -217,10 +252,13 @@ def are_hosts_in_status(
         )
         raise Exception("All the nodes must be in valid status, but got some in error")
 
-    log.info(
+    hosts_statuses = [(host["id"], host["status"], host["status_info"]) for host in hosts]
+    status_log.info(
+        ("hosts_status", hosts[0].get("cluster_id") if hosts else None, tuple(statuses)),
+        hosts_statuses,
         "Asked hosts to be in one of the statuses from %s and currently hosts statuses are %s",
         statuses,
-        [(host["id"], host["status"], host["status_info"]) for host in hosts],
+        hosts_statuses,
     )
     return False
 
@@ -237,9 +275,9 @@ def wait_till_hosts_with_macs_are_in_status(
     log.info("Wait till %s nodes are in one of the statuses %s", len(macs), statuses)
 
     try:
-        waiting.wait(
-            lambda: are_hosts_in_status(
-                get_cluster_hosts_with_mac(client, cluster_id, macs),
+        ClusterStateWatcher.get(client, cluster_id).wait(
+            lambda snapshot: are_hosts_in_status(
+                snapshot.get_hosts_with_macs(macs),
                 len(macs),
                 statuses,
                 fall_on_error_status,
@@ -247,6 +285,7 @@ def wait_till_hosts_with_macs_are_in_status(
             timeout_seconds=timeout,
             sleep_seconds=interval,
             waiting_for="Nodes to be in of the statuses %s" % statuses,
+            abortable=not expects_failure(statuses),
         )
     except:
         hosts = get_cluster_hosts_with_mac(client, cluster_id, macs)
@@ -266,9 +305,9 @@ def wait_till_all_hosts_are_in_status(
     log.info("Wait till %s nodes are in one of the statuses %s", nodes_count, statuses)
 
     try:
-        waiting.wait(
-            lambda: are_hosts_in_status(
-                client.get_cluster_hosts(cluster_id),
+        ClusterStateWatcher.get(client, cluster_id).wait(
+            lambda snapshot: are_hosts_in_status(
+                snapshot.hosts,
                 nodes_count,
                 statuses,
                 fall_on_error_status,
@@ -276,6 +315,7 @@ def wait_till_all_hosts_are_in_status(
             timeout_seconds=timeout,
             sleep_seconds=interval,
             waiting_for="Nodes to be in of the statuses %s" % statuses,
+            abortable=not expects_failure(statuses),
         )
     except:
         hosts = client.get_cluster_hosts(cluster_id)
@@ -295,9 +335,9 @@ def wait_till_at_least_one_host_is_in_status(
     log.info("Wait till 1 node is in one of the statuses %s", statuses)
 
     try:
-        waiting.wait(
-            lambda: are_hosts_in_status(
-                client.get_cluster_hosts(cluster_id),
+        ClusterStateWatcher.get(client, cluster_id).wait(
+            lambda snapshot: are_hosts_in_status(
+                snapshot.hosts,
                 nodes_count,
                 statuses,
                 fall_on_error_status,
@@ -305,6 +345,7 @@ def wait_till_at_least_one_host_is_in_status(
             timeout_seconds=timeout,
             sleep_seconds=interval,
             waiting_for="Node to be in of the statuses %s" % statuses,
+            abortable=not expects_failure(statuses),
         )
     except:
         hosts = client.get_cluster_hosts(cluster_id)
@@ -325,9 +366,9 @@ def wait_till_specific_host_is_in_status(
     log.info(f"Wait till {nodes_count} host is in one of the statuses: {statuses}")
 
     try:
-        waiting.wait(
-            lambda: are_hosts_in_status(
-                [client.get_host_by_name(cluster_id, host_name)],
+        ClusterStateWatcher.get(client, cluster_id).wait(
+            lambda snapshot: are_hosts_in_status(
+                [host for host in [snapshot.get_host_by_name(host_name)] if host],
                 nodes_count,
                 statuses,
                 fall_on_error_status,
@@ -335,6 +376,7 @@ def wait_till_specific_host_is_in_status(
             timeout_seconds=timeout,
             sleep_seconds=interval,
             waiting_for="Node to be in of the statuses %s" % statuses,
+            abortable=not expects_failure(statuses),
         )
     except:
         hosts = client.get_cluster_hosts(cluster_id)
@@ -352,9 +394,9 @@ def wait_till_at_least_one_host_is_in_stage(
 ):
     log.info(f"Wait till {nodes_count} node is in stage {stages}")
     try:
-        waiting.wait(
-            lambda: are_host_progress_in_stage(
-                client.get_cluster_hosts(cluster_id),
+        ClusterStateWatcher.get(client, cluster_id).wait(
+            lambda snapshot: are_host_progress_in_stage(
+                snapshot.hosts,
                 stages,
                 nodes_count,
             ),
@@ -371,15 +413,19 @@ def wait_till_at_least_one_host_is_in_stage(
 
 
 def are_host_progress_in_stage(hosts, stages, nodes_count=1):
-    log.info("Checking hosts installation stage")
     hosts_in_stage = [host for host in hosts if
                       (host["progress"]["current_stage"]) in stages]
     if len(hosts_in_stage) >= nodes_count:
         return True
     host_info = [(host["id"], (host["progress"]["current_stage"])) for host in hosts]
-    log.info(
-        f"Asked {nodes_count} hosts to be in one of the statuses from {stages} and currently "
-        f"hosts statuses are {host_info}")
+    status_log.info(
+        ("hosts_stage", hosts[0].get("cluster_id") if hosts else None, tuple(stages)),
+        host_info,
+        "Asked %s hosts to be in one of the statuses from %s and currently hosts statuses are %s",
+        nodes_count,
+        stages,
+        host_info,
+    )
     return False
 
 
@@ -388,15 +434,12 @@ def wait_till_cluster_is_in_status(
 ):
     log.info("Wait till cluster %s is in status %s", cluster_id, statuses)
     try:
-        waiting.wait(
-            lambda: is_cluster_in_status(
-                client=client,
-                cluster_id=cluster_id,
-                statuses=statuses
-            ),
+        ClusterStateWatcher.get(client, cluster_id).wait(
+            lambda snapshot: is_cluster_snapshot_in_status(snapshot, statuses),
             timeout_seconds=timeout,
             sleep_seconds=interval,
             waiting_for="Cluster to be in status %s" % statuses,
+            abortable=not expects_failure(statuses),
         )
     except:
         log.error("Cluster status is: %s", client.cluster_get(cluster_id).status)
@@ -404,40 +447,39 @@ def wait_till_cluster_is_in_status(
 
 
 def is_cluster_in_status(client, cluster_id, statuses):
-    log.info("Is cluster %s in status %s", cluster_id, statuses)
     try:
         cluster_status = client.cluster_get(cluster_id).status
         if cluster_status in statuses:
             return True
         else:
-            log.info(f"Cluster not yet in its required status. "
-                     f"Current status: {cluster_status}")
+            status_log.info(("cluster_status", cluster_id, tuple(statuses)), cluster_status,
+                            "Cluster %s not yet in its required status %s. Current status: %s",
+                            cluster_id, statuses, cluster_status)
             return False
     except:
         log.exception("Failed to get cluster %s info", cluster_id)
 
 
+def is_cluster_snapshot_in_status(snapshot, statuses):
+    if snapshot.status in statuses:
+        return True
+    status_log.info(("cluster_status", snapshot.cluster.id, tuple(statuses)), snapshot.status,
+                    "Cluster %s not yet in its required status %s. Current status: %s",
+                    snapshot.cluster.id, statuses, snapshot.status)
+    return False
+
+
 def get_cluster_validation_value(cluster_info, validation_section, validation_id):
-    found_status = "validation not found"
-    validations = json.loads(cluster_info.validations_info)
-    for validation in validations[validation_section]:
-        if validation['id'] == validation_id:
-            found_status = validation['status']
-            break
-    return found_status
+    validations = index_validations(cluster_info.validations_info)
+    return validations.get((validation_section, validation_id), "validation not found")
 
 
 def get_host_validation_value(cluster_info, host_id, validation_section, validation_id):
     for host in cluster_info.hosts:
         if host.id != host_id:
             continue
-        found_status = "validation not found"
-        validations = json.loads(host.validations_info)
-        for validation in validations[validation_section]:
-            if validation['id'] == validation_id:
-                found_status = validation['status']
-                break
-        return found_status
+        validations = index_validations(host.validations_info)
+        return validations.get((validation_section, validation_id), "validation not found")
     return "host not found"
 
 
@@ -544,7 +586,7 @@ def get_local_assisted_service_url(profile, namespace, service, deploy_target):
 
 def is_assisted_service_reachable(url):
     try:
-        r = requests.get(url + '/health', timeout=10, verify=False)
+        r = connection_pool.get_session().get(url + '/health', timeout=10, verify=False)
         return r.status_code == 200
     except (
             requests.ConnectionError,
@@ -645,7 +687,7 @@ def _merge(leases, hosts):
 
 def get_network_leases(network_name):
     with file_lock_context():
-        net = conn.networkLookupByName(network_name)
+        net = libvirt_connection.get_connection().networkLookupByName(network_name)
         leases = net.DHCPLeases()  # TODO: getting the information from the XML dump until dhcp-leases bug is fixed
         hosts = _get_hosts_from_network(net)
         return _merge(leases, hosts)
@@ -800,12 +842,7 @@ def update_hosts(client, cluster_id, libvirt_nodes, update_hostnames=False, upda
 
     for libvirt_mac, libvirt_metadata in libvirt_nodes.items():
         for host in inventory_hosts:
-            inventory = json.loads(host["inventory"])
-
-            if libvirt_mac.lower() in map(
-                    lambda interface: interface["mac_address"].lower(),
-                    inventory["interfaces"],
-            ):
+            if get_host_view(host).has_mac(libvirt_mac):
                 roles.append({"id": host["id"], "role": libvirt_metadata["role"]})
                 hostnames.append({"id": host["id"], "hostname": libvirt_metadata["name"]})
 
@@ -2,79 +2,69 @@
 # -*- coding: utf-8 -*-
 
 import argparse
-import subprocess
+import re
+from contextlib import suppress
+
+import libvirt
 
 from test_infra import utils
+from test_infra.tools import libvirt_connection
 
 from logger import log
 
 DEFAULT_SKIP_LIST = ["default"]
 
 
-def run_command(command, check=False, resource_filter=None):
-    if resource_filter:
-        command += '| grep -E "%s"' % "|".join(resource_filter)
-    process = subprocess.run(
-        command,
-        shell=True,
-        check=check,
-        stdout=subprocess.PIPE,
-        universal_newlines=True,
-    )
-    output = process.stdout.strip()
-    return output
+def _is_filtered_out(name, resource_filter):
+    return bool(resource_filter) and re.search("|".join(resource_filter), name) is None
 
 
 def clean_domains(skip_list, resource_filter):
-    domains = run_command(
-        "virsh -c qemu:///system list --all --name", resource_filter=resource_filter
-    )
-    domains = domains.splitlines()
-    for domain in domains:
-        log.info("Deleting domain %s", domain)
-        if domain and domain not in skip_list:
-            run_command("virsh -c qemu:///system destroy %s" % domain, check=False)
-            run_command("virsh -c qemu:///system undefine %s" % domain, check=False)
+    for domain in libvirt_connection.get_connection().listAllDomains():
+        name = domain.name()
+        if name in skip_list or _is_filtered_out(name, resource_filter):
+            continue
+        log.info("Deleting domain %s", name)
+        with suppress(libvirt.libvirtError):
+            if domain.isActive():
+                domain.destroy()
+        with suppress(libvirt.libvirtError):
+            domain.undefine()
 
 
 def clean_volumes(pool):
-    volumes_with_path = run_command(
-        "virsh -c qemu:///system vol-list %s | tail -n +3" % pool
-    ).splitlines()
-    for volume_with_path in volumes_with_path:
-        volume, _ = volume_with_path.split()
-        if volume:
-            log.info("Deleting volume %s in pool %s", volume, pool)
-            run_command(
-                "virsh -c qemu:///system vol-delete --pool %s %s" % (pool, volume),
-                check=False,
-            )
+    with suppress(libvirt.libvirtError):
+        for volume in pool.listAllVolumes():
+            log.info("Deleting volume %s in pool %s", volume.name(), pool.name())
+            with suppress(libvirt.libvirtError):
+                volume.delete()
 
 
 def clean_pools(skip_list, resource_filter):
-    pools = run_command(
-        "virsh -c qemu:///system pool-list --all --name",
-        resource_filter=resource_filter,
-    )
-    pools = pools.splitlines()
-    for pool in pools:
-        if pool and pool not in skip_list:
-            clean_volumes(pool)
-            log.info("Deleting pool %s", pool)
-            run_command("virsh -c qemu:///system pool-destroy %s" % pool, check=False)
-            run_command("virsh -c qemu:///system pool-undefine %s" % pool, check=False)
+    for pool in libvirt_connection.get_connection().listAllStoragePools():
+        name = pool.name()
+        if name in skip_list or _is_filtered_out(name, resource_filter):
+            continue
+        clean_volumes(pool)
+        log.info("Deleting pool %s", name)
+        with suppress(libvirt.libvirtError):
+            if pool.isActive():
+                pool.destroy()
+        with suppress(libvirt.libvirtError):
+            pool.undefine()
 
 
 def clean_networks(skip_list, resource_filter):
-    networks = run_command(
-        "virsh -c qemu:///system net-list --all --name", resource_filter=resource_filter
-    )
-    networks = networks.splitlines()
-    for net in networks:
-        if net and net not in skip_list:
-            log.info("Deleting network %s", net)
-            run_command("virsh -c qemu:///system net-destroy %s" % net, check=False)
-            run_command("virsh -c qemu:///system net-undefine %s" % net, check=False)
+    for net in libvirt_connection.get_connection().listAllNetworks():
+        name = net.name()
+        if name in skip_list or _is_filtered_out(name, resource_filter):
+            continue
+        log.info("Deleting network %s", name)
+        with suppress(libvirt.libvirtError):
+            if net.isActive():
+                net.destroy()
+        with suppress(libvirt.libvirtError):
+            net.undefine()
 
 
 def clean_virsh_resources(skip_list, resource_filter):
@@ -76,6 +76,9 @@ class BaseTest:
             return res
         yield get_cluster_func
         for cluster in clusters:
+            if not cluster.timeline.is_empty:
+                with suppress(OSError):
+                    cluster.timeline.export(f"{env_variables['log_folder']}/{request.node.name}")
             if request.node.result_call.failed:
                 logging.info(f'--- TEARDOWN --- Collecting Logs for test: {request.node.name}\n')
                 self.collect_test_logs(cluster, api_client, request.node, nodes)
@@ -7,6 +7,7 @@ from pathlib import Path
 
 import pytest
 from test_infra import assisted_service_api, consts, utils
+from test_infra.tools import api_metrics
 
 qe_env = False
 
@@ -94,6 +95,20 @@ def get_api_client(offline_token=env_variables['offline_token'], **kwargs):
     return assisted_service_api.create_client(url, offline_token, **kwargs)
 
 
+@pytest.fixture(scope="session", autouse=True)
+def api_metrics_properties(request):
+    # The properties only end up in a JUnit XML report, nothing to record them to without --junitxml
+    if not request.config.pluginmanager.hasplugin("junitxml") or not request.config.getoption("xmlpath", None):
+        yield
+        return
+
+    record_testsuite_property = request.getfixturevalue("record_testsuite_property")
+    yield
+    for endpoint, stats in api_metrics.get_metrics().to_dict().items():
+        for name in ("count", "errors", "retries", "response_bytes", "total_seconds", "p50", "p95", "p99"):
+            record_testsuite_property(f"api {endpoint} {name}", stats[name])
+
+
 @pytest.fixture(scope="session")
 def setup_node_controller():
     logging.info(f'--- SETUP --- node controller\n')